@@ -1,15 +1,34 @@
-from src.handle_zim.readzim import ReadZIM
+from src.handle_zim.readzim import PrefetchedContent, ReadZIM
 import sys
 import os
 import logging
 import argparse
-from datetime import datetime
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
-from src.html_parser.html_processor import SCPHtmlProcessor
+from src.html_parser.html_processor import CLEANER_VERSION, SCPHtmlProcessor
+from src.html_parser.parse_cache import ParseCache
+from src.html_parser.metadata_extractor import MetadataReport, extract_metadata
 from tqdm import tqdm
-from src.utils.filepath_tool import get_scp_subdirectory, scp_num_generator
+from src.utils.filepath_tool import (
+    build_article_link_map, get_scp_subdirectory, get_vault_relative_path, scp_num_generator)
 from src.utils.processing_tracker import SCPProcessingTracker
+from src.utils.log_tool import HOT, setup_logging, shutdown_logging
+from src.utils.output_sink import OutputSink, DirectorySink, Manifest, create_output_sink
+from src.utils.index_notes import IndexNotes, object_class_from_tags
+from src.utils.frontmatter import build_frontmatter
+from src.utils.image_stage import ImageStage
+from src.utils.asset_store import AssetStore
+from src.utils.tag_stats import TagStats
+from src.utils.vault_verifier import PROBLEM_KINDS, VaultVerifier
+from src.utils.dify_uploader import DifyClient, DifyUploader
+from src.utils.watchdog import ItemBudgetExceeded, ItemWatchdog
+from src.utils.memory_profile import MemoryProfiler
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
@@ -17,6 +36,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 load_dotenv()
 
 
+# 可以用路径分隔符（Windows 为 ";"，其他系统为 ":"）指定多个 ZIM 文件，第一个为主归档
 SCP_OFFLINE_ZIM_PATH = os.getenv("SCP_OFFLINE_ZIM_PATH")
 if not SCP_OFFLINE_ZIM_PATH:
     raise ValueError("请设置环境变量 SCP_OFFLINE_ZIM_PATH 指向 SCP ZIM 文件的路径")
@@ -26,32 +46,15 @@ if not SCP_MD_OUTPUT_DIR:
 if SCP_MD_OUTPUT_DIR and SCP_MD_OUTPUT_DIR[-1] == '/':
     SCP_MD_OUTPUT_DIR = SCP_MD_OUTPUT_DIR[:-1]
 
-# 设置日志系统
+# 导出状态目录（旁路索引等），Obsidian 会忽略以 . 开头的目录
+STATE_DIR = os.path.join(SCP_MD_OUTPUT_DIR, '.scp-obsidian')
+
+# 日志目录（日志系统在 main 中根据命令行参数配置）
 LOG_DIR = 'logs'
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# 创建日志格式器
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-
-# 创建文件处理器（记录所有级别的日志）
-file_handler = logging.FileHandler(
-    os.path.join(
-        LOG_DIR, f'scp_processing_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'),
-    encoding='utf-8'
-)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(formatter)
-
-# 创建控制台处理器（只显示警告和错误）
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.WARNING)
-console_handler.setFormatter(formatter)
-
-# 配置根日志记录器
-logging.basicConfig(
-    level=logging.DEBUG,  # 设置为DEBUG以确保所有日志都被处理
-    handlers=[file_handler, console_handler]
-)
+# 缓存目录（解析结果、转码图片），放在库之外，避免随库发布或复制
+CACHE_DIR = 'cache'
 
 logger = logging.getLogger(__name__)
 
@@ -82,64 +85,175 @@ def print_progress_info(message):
 # 创建全局跟踪器实例
 tracker = SCPProcessingTracker(LOG_DIR)
 
+# 全局输出目标（默认直接写入输出目录，main 中根据参数替换），所有归档共用
+output_sink: OutputSink = DirectorySink(SCP_MD_OUTPUT_DIR)
+
+# 全局图片转码阶段（启用 --image-format 时在 main 中创建）
+image_stage: Optional[ImageStage] = None
+
+# 全局解析结果缓存（--parse-cache-size 为 0 时不启用）
+parse_cache: Optional[ParseCache] = None
+
+# 全局标签统计（--no-index 时不启用）
+tag_stats: Optional[TagStats] = None
+
+# 全局元数据提取统计，无法用规则解析的条目记入智能体队列
+metadata_report = MetadataReport(os.path.join(STATE_DIR, 'agent-queue.json'))
+
+# 全局条目处理看门狗（设置了 --item-timeout 或 --memory-limit 时在 main 中创建）
+watchdog: Optional[ItemWatchdog] = None
+
+# 全局条目内存采样（启用 --memory-profile 时在 main 中创建）
+memory_profiler: Optional[MemoryProfiler] = None
+
+# 低内存模式：每个阶段结束后立即释放解析树等中间结果
+low_memory = False
 
-def make_obsidian_md(zim: ReadZIM, scp_id: str, respect_completed: bool = True) -> bool:
+# 全局图片资源表，多个归档中相同内容的图片只保存一份
+asset_store = AssetStore(os.path.join(STATE_DIR, 'assets.json'))
+
+# 停止信号，用户中断时通知各归档的处理线程
+stop_event = threading.Event()
+
+
+@dataclass
+class ArchiveContext:
+    """
+    一个 ZIM 归档的导出上下文
+
+    主归档的 label 为空，笔记直接写入输出目录；其余归档的笔记写入以 label 命名的子目录。
+    """
+    zim: ReadZIM
+    label: str = ""
+    language: str = ""
+    # 站内条目链接 -> 笔记名，用于把条目链接改写为 [[scp-xxx]]
+    article_links: Dict[str, str] = field(default_factory=dict)
+    index_notes: Optional[IndexNotes] = None
+    # 其他归档，用于链接同一条目的其他语言版本
+    others: list["ArchiveContext"] = field(default_factory=list)
+
+    def item_key(self, scp_id: str) -> str:
+        """跟踪器中使用的条目键，主归档为 "scp-173"，其他归档为 "eng:scp-173" """
+        return f"{self.label}:{scp_id}" if self.label else scp_id
+
+    def note_dir(self, scp_id: str) -> str:
+        """笔记所在的库内目录，如 "001-1000" 或 "eng/001-1000" """
+        subdirectory = get_scp_subdirectory(scp_id)
+        return f"{self.label}/{subdirectory}" if self.label else subdirectory
+
+
+def abortable_stage():
+    """可以被看门狗中止的处理阶段（解析和转换），其余步骤不会被中止到一半"""
+    return watchdog.abortable() if watchdog is not None else nullcontext()
+
+
+def make_obsidian_md(context: ArchiveContext, scp_id: str, respect_completed: bool = True,
+                     prefetched: Optional[PrefetchedContent] = None) -> bool:
     """
     make the scp markdown file how to use the SCP ZIM.
+    context: 条目所在归档的导出上下文
     scp_id: The ID of the SCP to generate the markdown for. like "scp-001","scp-8002"
     respect_completed: 是否尊重已完成列表，False时会重新处理已完成的项目
+    prefetched: ReadZIM.iter_contents 预读的内容，为 None 时直接从 ZIM 读取
     """
+    zim = context.zim
+    item_key = context.item_key(scp_id)
     try:
         # 检查是否已经处理过
-        if tracker.should_skip(scp_id, respect_completed=respect_completed):
-            logger.info(f"[SKIP] 跳过已处理的项目: {scp_id}")
+        if tracker.should_skip(item_key, respect_completed=respect_completed):
+            logger.info("[SKIP] 跳过已处理的项目: %s", item_key, extra=HOT)
             return True
 
-        logger.info(f"[PROCESSING] 开始处理: {scp_id}")
-        content = zim.get_content(scp_id)
+        logger.info("[PROCESSING] 开始处理: %s", item_key, extra=HOT)
 
-        if not content:
+        # 笔记所在目录，以及分片归档的分片名
+        subdirectory = context.note_dir(scp_id)
+        shard = subdirectory.replace('/', '-')
+
+        # 同一归档（UUID 相同）中的条目内容不会变化，可以直接使用缓存的清理结果
+        uuid = str(zim.archive.uuid) if zim.archive is not None else ""
+        cached = parse_cache.get(uuid, scp_id, CLEANER_VERSION) if parse_cache is not None else None
+        if cached:
+            content = None
+        elif prefetched is not None:
+            content = prefetched.content
+        else:
+            content = zim.get_content(scp_id)
+
+        if not cached and not content:
+            # 条目已不存在时删除之前导出的文件
+            output_sink.remove(f"{subdirectory}/{scp_id}.md")
+            if context.index_notes is not None:
+                context.index_notes.remove(scp_id)
+            if tag_stats is not None:
+                tag_stats.remove(item_key)
             tracker.record_failure(
-                scp_id, "无法获取内容", {"reason": "content is None or empty"})
+                item_key, "无法获取内容", {"reason": "content is None or empty"})
             return False
 
-        html_processor = SCPHtmlProcessor(content)
+        # 先改写链接再转换 Markdown
+        with abortable_stage():
+            if cached:
+                html_processor = SCPHtmlProcessor.from_cache_entry(cached, low_memory=low_memory)
+            else:
+                html_processor = SCPHtmlProcessor(content, convert=False, low_memory=low_memory)
+        # 原始 HTML 已解析完毕
+        from_cache = bool(cached)
+        content = cached = None
 
         if not html_processor.page_content_div:
-            tracker.record_failure(scp_id, "无法解析页面内容", {
+            tracker.record_failure(item_key, "无法解析页面内容", {
                                    "reason": "page_content_div is None"})
             return False
 
+        if parse_cache is not None and not from_cache:
+            parse_cache.put(uuid, scp_id, CLEANER_VERSION, html_processor.to_cache_entry())
+
+        # 按规则提取项目等级、收容等级和站点（需在改写链接之前）
+        metadata = extract_metadata(html_processor.page_content_div)
+        metadata_report.record(item_key, metadata)
+
         img_sources = html_processor.extract_image_sources()
         details: Dict[str, Any] = {"images_found": len(img_sources)}
 
+        # 图片源路径 -> 笔记中使用的相对路径
+        image_map: Dict[str, str] = {}
+
         # 处理图片
         if img_sources and SCP_MD_OUTPUT_DIR is not None:
             successful_images = 0
             failed_images = 0
 
             for img_src in img_sources:
-                # 提取并保存图片
-                img_data = zim.get_img(img_src)
+                # 提取并保存图片，优先使用预读的数据（预读时已查找过的图片不再查找）
+                if prefetched is not None and img_src in prefetched.images:
+                    img_data = prefetched.images[img_src]
+                else:
+                    img_data = zim.get_img(img_src)
                 if img_data:
-                    # 保持原始目录结构，构建完整保存路径
-                    save_path = os.path.join(SCP_MD_OUTPUT_DIR, img_src)
-
-                    # 自动创建所需的目录结构
-                    save_dir = os.path.dirname(save_path)
-                    os.makedirs(save_dir, exist_ok=True)
-
-                    # 保存图片文件
-                    with open(save_path, 'wb') as f:
-                        f.write(img_data)
-
-                    logger.info(f"[IMAGE] 图片已保存: {os.path.basename(img_src)}")
-
-                    # # 更新HTML中的图片路径（使用相对路径）
-                    # html_processor.update_image_paths(img_src, img_src)
+                    # 相同内容的图片（包括其他归档中的）只保存一份
+                    vault_path, is_new = asset_store.claim(img_src, img_data, context.label)
+                    if image_stage is not None:
+                        # 转码在进程池中完成后再写出，Markdown 中改用转码后的文件名
+                        if is_new:
+                            new_src = image_stage.submit(
+                                vault_path, img_data,
+                                lambda path, data: output_sink.write_bytes(path, data, shard=shard))
+                            asset_store.set_output(vault_path, new_src)
+                        else:
+                            new_src = image_stage.output_path(vault_path, img_data)
+                    else:
+                        # 保持原始目录结构保存图片
+                        if is_new:
+                            output_sink.write_bytes(vault_path, img_data, shard=shard)
+                        new_src = vault_path
+
+                    logger.info("[IMAGE] 图片已保存: %s", vault_path, extra=HOT)
+
+                    image_map[img_src] = get_vault_relative_path(new_src, subdirectory)
                     successful_images += 1
                 else:
-                    logger.warning(f"[WARNING] 图片提取失败: {img_src}")
+                    logger.warning("[WARNING] 图片提取失败: %s", img_src)
                     failed_images += 1
 
             details.update({
@@ -149,51 +263,397 @@ def make_obsidian_md(zim: ReadZIM, scp_id: str, respect_completed: bool = True)
 
         elif img_sources and SCP_MD_OUTPUT_DIR is None:
             error_msg = "SCP_MD_OUTPUT_DIR 环境变量未设置"
-            tracker.record_failure(scp_id, error_msg, details)
+            tracker.record_failure(item_key, error_msg, details)
             raise ValueError(error_msg)
 
+        # 一次遍历改写图片路径和站内链接，然后转换为 Markdown
+        with abortable_stage():
+            details.update(html_processor.rewrite_links(image_map, context.article_links))
+            converted = html_processor.convert_to_markdown()
+        if not converted:
+            tracker.record_failure(item_key, "HTML转Markdown失败", details)
+            return False
+
         # 生成 Markdown 文件
-        md_content = f'{html_processor.page_content}'
+        # 标题优先使用系列索引页中的标题
+        title = zim.get_title(scp_id) or html_processor.page_title
+        scp_name = scp_id.upper()
+        # 其他归档中的同一条目（翻译或原文）
+        translations = [
+            f"[[{other.note_dir(scp_id)}/{scp_id}|{other.language or other.label}]]"
+            for other in context.others if other.zim.has_content(scp_id)
+        ]
+        frontmatter = build_frontmatter({
+            "title": title,
+            "aliases": [scp_name] + ([title] if title and title != scp_name else []),
+            "language": context.language,
+            **metadata.to_properties(),
+            "translations": translations,
+        })
+        md_content = f'{frontmatter}{html_processor.page_content}'
 
         # 检查输出目录是否存在
         if SCP_MD_OUTPUT_DIR is None:
             error_msg = "SCP_MD_OUTPUT_DIR 环境变量未设置"
-            tracker.record_failure(scp_id, error_msg, details)
+            tracker.record_failure(item_key, error_msg, details)
             raise ValueError(error_msg)
 
-        # 确定子目录
-        subdirectory = get_scp_subdirectory(scp_id)
-        output_dir = os.path.join(SCP_MD_OUTPUT_DIR, subdirectory)
-
-        # 创建子目录（如果不存在）
-        os.makedirs(output_dir, exist_ok=True)
-
-        # 构建完整的输出文件路径
-        output_file = os.path.join(output_dir, f"{scp_id}.md")
+        if html_processor.page_tags:
+            md_content += f"\n\n\n{' '.join(html_processor.page_tags)}"
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(md_content)
-            if html_processor.page_tags:
-                f.write(f"\n\n\n{' '.join(html_processor.page_tags)}")
+        # 构建输出文件路径（相对于输出目录）
+        output_file = f"{subdirectory}/{scp_id}.md"
+        output_sink.write_text(output_file, md_content, shard=shard)
 
         details.update({
             "output_file": output_file,
             "subdirectory": subdirectory,
             "tags_count": len(html_processor.page_tags),
-            "content_length": len(md_content)
+            "metadata_parsed": metadata.parsed,
+            "content_length": len(html_processor.page_content)
         })
 
-        tracker.record_success(scp_id, details)
+        if context.index_notes is not None:
+            raw_tags = html_processor.raw_tags
+            object_class = metadata.object_class or metadata.containment_class or object_class_from_tags(raw_tags)
+            context.index_notes.update(scp_id, title, object_class, raw_tags)
+        if tag_stats is not None:
+            tag_stats.update(item_key, html_processor.raw_tags)
+
+        tracker.record_success(item_key, details)
         return True
 
     except Exception as e:
         error_msg = f"处理过程中发生异常: {str(e)}"
-        tracker.record_failure(scp_id, error_msg, {
+        tracker.record_failure(item_key, error_msg, {
                                "exception_type": type(e).__name__})
-        logger.exception(f"处理 {scp_id} 时发生异常")
+        logger.exception("处理 %s 时发生异常", item_key)
+        return False
+
+
+def export_item(context: ArchiveContext, scp_id: str, respect_completed: bool = True,
+                prefetched: Optional[PrefetchedContent] = None) -> bool:
+    """
+    在看门狗的时间和内存预算内处理一个条目，超出预算时记录为 "timeout" 或 "memory" 类型的失败
+
+    参数同 make_obsidian_md
+    """
+    item_key = context.item_key(scp_id)
+    task, task_args = make_obsidian_md, (context, scp_id, respect_completed, prefetched)
+    if memory_profiler is not None:
+        task, task_args = memory_profiler.run, (item_key, task, *task_args)
+    if watchdog is None:
+        return task(*task_args)
+    try:
+        return watchdog.run(item_key, task, *task_args)
+    except ItemBudgetExceeded as e:
+        tracker.record_failure(item_key, str(e), {
+            "item_timeout": watchdog.time_limit,
+            "memory_limit": watchdog.memory_limit,
+        }, failure_class=e.failure_class)
         return False
 
 
+def open_zims(zim_paths: list[str]) -> list[tuple[str, str, ReadZIM]]:
+    """
+    只打开所有 ZIM 归档，并确定各归档的子目录名
+
+    Args:
+        zim_paths: ZIM 文件路径列表，第一个为主归档
+
+    Returns:
+        list[tuple[str, str, ReadZIM]]: (子目录名, 语言代码, 归档) 列表，主归档的子目录名为空
+    """
+    archives: list[tuple[str, str, ReadZIM]] = []
+    used_labels: set[str] = set()
+    for i, zim_path in enumerate(zim_paths):
+        zim = ReadZIM(zim_path)
+        zim.read_zim()
+        language = zim.get_language()
+
+        label = ""
+        if i > 0:
+            # 其他归档以语言代码命名子目录，重复或缺失时使用文件名
+            label = language
+            if not label or label in used_labels:
+                label = os.path.splitext(os.path.basename(zim_path))[0]
+            used_labels.add(label)
+        archives.append((label, language, zim))
+    return archives
+
+
+def open_archives(zim_paths: list[str], with_index: bool) -> list[ArchiveContext]:
+    """
+    打开所有 ZIM 归档并创建导出上下文
+
+    Args:
+        zim_paths: ZIM 文件路径列表，第一个为主归档
+        with_index: 是否维护索引笔记
+
+    Returns:
+        list[ArchiveContext]: 导出上下文列表
+    """
+    contexts: list[ArchiveContext] = []
+    for label, language, zim in open_zims(zim_paths):
+        zim.load_title_map(STATE_DIR)
+        context = ArchiveContext(
+            zim=zim,
+            label=label,
+            language=language,
+            article_links=build_article_link_map(prefix=label, exists=zim.has_content),
+        )
+        if with_index:
+            context.index_notes = IndexNotes(STATE_DIR, output_sink, prefix=label)
+        contexts.append(context)
+
+    for context in contexts:
+        context.others = [other for other in contexts if other is not context]
+    return contexts
+
+
+def run_batch(context: ArchiveContext, args, position: int = 0):
+    """
+    批量处理一个归档中的 SCP 文档
+
+    Args:
+        context: 归档的导出上下文
+        args: 命令行参数
+        position: 进度条位置，多个归档同时处理时各占一行
+    """
+    label_desc = f"处理SCP文档[{context.label}]" if context.label else "处理SCP文档"
+
+    # 确定处理范围
+    start_num = args.start
+    end_num = args.end
+
+    # 断点接续模式
+    if args.resume:
+        # 断点只记录主归档的进度，其他归档依靠已完成列表跳过；
+        # 按大小排序时处理顺序与编号无关，同样只依靠已完成列表跳过
+        if not context.label and not args.largest_first:
+            start_num = tracker.get_resume_point()
+        print_info(f"{label_desc} 断点接续模式: 从 SCP-{start_num:03d} 开始")
+    else:
+        # 如果不是断点接续模式，可以选择性地清除已完成列表
+        # 这里我们不自动清除，而是通过不检查已完成列表来实现重新开始
+        print_info(f"{label_desc} 重新开始模式: 从 SCP-{start_num:03d} 开始（将重新处理所有项目）")
+
+    # 批量处理
+    print_info(f"开始批量处理SCP文档: SCP-{start_num:03d} 到 SCP-{end_num:03d}")
+    failed_count = 0
+    max_consecutive_failures = args.max_failures
+
+    # 计算总数量和已完成数量用于进度条
+    total_count = end_num - start_num + 1
+    completed_in_range = 0
+
+    # 如果是断点接续，计算已完成的数量
+    if args.resume:
+        for i in range(start_num, end_num + 1):
+            scp_check_id = context.item_key(f"scp-{i:03d}")
+            if tracker.should_skip(scp_check_id, respect_completed=True):
+                completed_in_range += 1
+
+    # 多线程处理时同时提交的条目数上限，结果按编号顺序取回
+    workers = max(1, args.workers)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    in_flight: deque = deque()
+
+    # 创建进度条
+    with tqdm(
+        total=total_count,
+        initial=completed_in_range,
+        desc=label_desc,
+        unit="个",
+        bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}] {desc}",
+        ncols=100,
+        file=sys.stdout,  # 明确指定输出流
+        leave=True,       # 完成后保留进度条
+        dynamic_ncols=True,  # 动态调整宽度
+        position=position
+    ) as pbar:
+
+        def finish_one():
+            """取回最早提交的一个条目的结果并更新进度"""
+            nonlocal failed_count
+            scp_id, result = in_flight.popleft()
+            success = result.result() if executor is not None else result
+
+            # 更新进度条描述
+            if success:
+                failed_count = 0  # 重置连续失败计数
+                pbar.set_description(f"{label_desc} [✓{scp_id}]")
+            else:
+                failed_count += 1
+                pbar.set_description(f"{label_desc} [✗{scp_id}]")
+
+            # 保存当前进度（用于断点接续），按大小排序时处理顺序与编号无关，不记录
+            if not context.label and not args.largest_first:
+                tracker.save_resume_point(int(scp_id[4:]))  # 去掉 "scp-" 前缀
+
+            # 更新进度条
+            pbar.update(1)
+
+            # 每处理100个项目打印一次统计
+            processed = tracker.status_data['current_session']['processed']
+            if position == 0 and processed % 100 == 0:
+                # 暂时停止进度条显示统计
+                pbar.clear()
+                tracker.print_summary()
+                pbar.refresh()
+
+            # 每处理10个项目更新进度条后缀信息
+            if processed % 10 == 0:
+                stats = tracker.get_statistics()
+                success_rate = stats['success_rate']
+                pbar.set_postfix({
+                    '成功': stats['current_session']['successful'],
+                    '失败': stats['current_session']['failed'],
+                    '成功率': f"{success_rate:.1f}%"
+                })
+
+        scp_ids = scp_num_generator(start_num, end_num)
+        if args.largest_first:
+            # 记录乱序处理的范围，中断后断点接续时从范围内最小的空缺开始
+            if not context.label:
+                tracker.record_unordered_run(start_num, end_num)
+            # 先处理内容最大的条目，避免大页面最后才开始处理而拖长整批的耗时
+            scp_ids = sorted(scp_ids, key=lambda scp_id: (
+                0 if tracker.should_skip(context.item_key(scp_id), respect_completed=args.resume)
+                else -context.zim.get_size(scp_id)))
+
+        scp_ids = list(scp_ids)
+        # 单线程处理时在后台预读之后的条目；多线程处理本身已经让读取和解析重叠。
+        # 跳过的条目和解析缓存中已有的条目不需要读取 ZIM，不预读
+        prefetcher = None
+        prefetch_ids: set[str] = set()
+        if executor is None and args.prefetch > 0:
+            uuid = str(context.zim.archive.uuid) if context.zim.archive is not None else ""
+            pending = [
+                scp_id for scp_id in scp_ids
+                if not tracker.should_skip(context.item_key(scp_id), respect_completed=args.resume)
+                and not (parse_cache is not None and parse_cache.contains(uuid, scp_id, CLEANER_VERSION))
+            ]
+            prefetch_ids = set(pending)
+            prefetcher = context.zim.iter_contents(pending, prefetch=args.prefetch)
+
+        try:
+            for scp_id in scp_ids:
+                if stop_event.is_set():
+                    break
+
+                if failed_count >= max_consecutive_failures:
+                    logger.warning(f"连续失败次数达到 {max_consecutive_failures}，停止处理")
+                    logger.info(f"当前处理到: {context.item_key(scp_id)}")
+                    break
+
+                # 检查是否需要跳过
+                if tracker.should_skip(context.item_key(scp_id), respect_completed=args.resume):
+                    pbar.set_description(f"{label_desc} [跳过{scp_id}]")
+                    # 对于跳过的项目，如果不是断点接续模式，也需要更新进度条
+                    if not args.resume or completed_in_range == 0:
+                        pbar.update(1)
+                    continue
+
+                if executor is not None:
+                    in_flight.append((scp_id, executor.submit(
+                        export_item, context, scp_id, args.resume)))
+                    if len(in_flight) >= workers * 2:
+                        finish_one()
+                else:
+                    prefetched = next(prefetcher) if scp_id in prefetch_ids else None
+                    in_flight.append((scp_id, export_item(
+                        context, scp_id, respect_completed=args.resume, prefetched=prefetched)))
+                    finish_one()
+
+            while in_flight:
+                finish_one()
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if prefetcher is not None:
+                prefetcher.close()
+
+
+def run_verify(args, zim_paths: list[str]):
+    """
+    校验导出的库：与输出清单、ZIM 归档和处理状态对比
+
+    Args:
+        args: 命令行参数
+        zim_paths: ZIM 文件路径列表
+    """
+    vault_dir = args.vault or SCP_MD_OUTPUT_DIR
+    state_dir = os.path.join(vault_dir, '.scp-obsidian')
+    manifest_file = os.path.join(state_dir, 'manifest.json')
+    if not os.path.exists(manifest_file):
+        # 库被复制到其他位置但没有带上状态目录时，使用本地的清单
+        manifest_file = os.path.join(STATE_DIR, 'manifest.json')
+    manifest = Manifest(manifest_file)
+    assets_file = os.path.join(os.path.dirname(manifest_file), 'assets.json')
+    print_info(f"开始校验库: {vault_dir}（清单: {len(manifest.files)} 个文件）")
+
+    # 校验只需要读取归档内容，不需要标题表和链接映射
+    verifier = VaultVerifier(
+        vault_dir, manifest.files, AssetStore(assets_file).sources,
+        {label: zim for label, _, zim in open_zims(zim_paths)},
+        list(tracker.status_data['completed_items']), args.verify_workers)
+
+    with tqdm(desc="校验库", unit="个", ncols=100, file=sys.stdout, dynamic_ncols=True) as pbar:
+        def on_progress(done: int, total: int):
+            pbar.total = total
+            pbar.update(done - pbar.n)
+
+        report = verifier.run(on_progress)
+
+    for kind, entries in report['problems'].items():
+        print_info(f"{PROBLEM_KINDS[kind]}: {len(entries)}")
+        for entry in entries[:10]:
+            tqdm.write(f"    {entry['path']} ({entry['detail']})")
+        if len(entries) > 10:
+            tqdm.write(f"    ... 另有 {len(entries) - 10} 个")
+
+    report_file = os.path.join(LOG_DIR, 'verify_report.json')
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_info(f"校验完成，共 {report['checked']} 项检查，详细结果: {report_file}")
+
+
+def run_upload(args):
+    """
+    将库中的 Markdown 笔记上传到 Dify 知识库
+
+    Args:
+        args: 命令行参数
+    """
+    api_key = os.getenv("DIFY_DATASETS_API_KEY")
+    dataset_id = os.getenv("DIFY_DATASET_ID")
+    if not api_key or not dataset_id:
+        raise ValueError("请设置环境变量 DIFY_DATASETS_API_KEY 和 DIFY_DATASET_ID")
+    base_url = os.getenv("DIFY_API_BASE_URL", "https://api.dify.ai/v1")
+
+    vault_dir = args.vault or SCP_MD_OUTPUT_DIR
+    client = DifyClient(base_url, api_key, dataset_id)
+    uploader = DifyUploader(client, tracker, vault_dir, workers=args.upload_workers)
+
+    documents = uploader.find_documents()
+    print_info(f"开始上传到 Dify 知识库: {len(documents)} 个文档，并发数 {uploader.workers}")
+    try:
+        with tqdm(total=len(documents), desc="上传文档", unit="个", ncols=100,
+                  file=sys.stdout, dynamic_ncols=True) as pbar:
+            def on_progress(rel_path: str, success: bool):
+                pbar.set_description(f"上传文档 [{'✓' if success else '✗'}{os.path.basename(rel_path)}]")
+                pbar.update(1)
+
+            uploader.upload_all(documents, on_progress)
+    finally:
+        client.close()
+
+    for key, value in uploader.stats().items():
+        print_info(f"{key}: {value}")
+    print_info("上传完成！")
+
+
 def parse_arguments():
     """
     解析命令行参数
@@ -208,6 +668,13 @@ def parse_arguments():
   python main.py --start 500 --end 1000   # 处理 SCP-500 到 SCP-1000
   python main.py --resume                 # 从上次中断的地方继续
   python main.py --single scp-173         # 只处理单个 SCP-173
+  python main.py --zim zh.zim --zim en.zim  # 同时处理中文分部和英文站，英文笔记写入 eng/ 子目录
+  python main.py --output-format tar --shard-by-range  # 按编号范围分片写入 tar 归档
+  python main.py --image-format webp --image-max-size 1200  # 图片转码为 WebP 并限制尺寸
+  python main.py --log-format json --log-sample 10  # JSON Lines 日志，热路径日志 10 取 1
+  python main.py --workers 8 --largest-first --item-timeout 60  # 大页面优先，单个条目最多处理 60 秒
+  python main.py --verify                 # 校验输出目录中的库是否完整
+  python main.py --upload-dify            # 将库中的笔记上传到 Dify 知识库（跳过未变化的文档）
         """
     )
 
@@ -251,24 +718,251 @@ def parse_arguments():
         help='最大连续失败次数，达到后停止处理 (默认: 10)'
     )
 
+    parser.add_argument(
+        '--zim',
+        action='append',
+        help='ZIM 文件路径，可多次指定以同时处理多个归档，第一个为主归档 (默认: SCP_OFFLINE_ZIM_PATH)'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='每个归档的处理线程数 (默认: 1)'
+    )
+
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=4,
+        help='单线程处理时在后台预读的条目数，0 表示不预读 (默认: 4)'
+    )
+
+    parser.add_argument(
+        '--largest-first',
+        action='store_true',
+        help='按 ZIM 中的内容大小从大到小处理条目，减少多线程处理时的长尾'
+    )
+
+    parser.add_argument(
+        '--item-timeout',
+        type=float,
+        default=0,
+        help='单个条目的最长处理时间（秒），超时的条目记为 timeout 失败，0 表示不限制 (默认: 0)'
+    )
+
+    parser.add_argument(
+        '--memory-limit',
+        type=int,
+        default=0,
+        help='进程内存上限 (MB)，超出时中止处理时间最长的条目并记为 memory 失败，0 表示不限制 (默认: 0)'
+    )
+
+    parser.add_argument(
+        '--memory-profile',
+        choices=['rss', 'tracemalloc'],
+        help='记录每个条目的内存占用并在摘要中列出最多的条目: rss 采样常驻内存，'
+             'tracemalloc 记录 Python 分配峰值（较慢，多线程时为近似值）'
+    )
+
+    parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='低内存模式：各处理阶段结束后立即释放解析树，适合在一台机器上运行更多线程'
+    )
+
+    parser.add_argument(
+        '--output-format',
+        choices=['dir', 'tar', 'zip'],
+        default='dir',
+        help='输出方式: dir 写入输出目录，tar/zip 流式写入单个归档 (默认: dir)'
+    )
+
+    parser.add_argument(
+        '--archive',
+        type=str,
+        help='归档文件路径 (默认: <SCP_MD_OUTPUT_DIR>.tar 或 .zip)'
+    )
+
+    parser.add_argument(
+        '--shard-by-range',
+        action='store_true',
+        help='按编号范围（如 001-1000）分片写入多个归档，各分片并行写入'
+    )
+
+    parser.add_argument(
+        '--no-index',
+        action='store_true',
+        help='不生成各编号范围的索引笔记（MOC）和标签统计'
+    )
+
+    parser.add_argument(
+        '--image-format',
+        choices=['webp', 'jpeg', 'png', 'avif'],
+        help='将 PNG/JPEG 等图片转码为指定格式（需要 Pillow），默认不转码'
+    )
+
+    parser.add_argument(
+        '--image-quality',
+        type=int,
+        default=80,
+        help='图片转码质量 1-100 (默认: 80)'
+    )
+
+    parser.add_argument(
+        '--image-max-size',
+        type=int,
+        default=1600,
+        help='转码后图片的最大边长，0 表示不缩放 (默认: 1600)'
+    )
+
+    parser.add_argument(
+        '--image-workers',
+        type=int,
+        help='图片转码进程数 (默认: CPU 核数)'
+    )
+
+    parser.add_argument(
+        '--parse-cache-size',
+        type=int,
+        default=512,
+        help='解析结果缓存的大小上限 (MB)，0 表示不使用缓存 (默认: 512)'
+    )
+
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=CACHE_DIR,
+        help=f'解析结果和转码图片的缓存目录，应位于库之外 (默认: {CACHE_DIR})'
+    )
+
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='不导出，校验库中的笔记和图片是否与输出清单、ZIM 归档一致，并找出多余文件'
+    )
+
+    parser.add_argument(
+        '--vault',
+        type=str,
+        help='要校验或上传的库目录，可以是复制到其他位置的库 (默认: SCP_MD_OUTPUT_DIR)'
+    )
+
+    parser.add_argument(
+        '--verify-workers',
+        type=int,
+        help='校验时的线程数 (默认: 由 CPU 核数决定)'
+    )
+
+    parser.add_argument(
+        '--upload-dify',
+        action='store_true',
+        help='不导出，将库中的笔记上传到 Dify 知识库（需要 DIFY_DATASETS_API_KEY 和 DIFY_DATASET_ID）'
+    )
+
+    parser.add_argument(
+        '--upload-workers',
+        type=int,
+        default=4,
+        help='同时上传的文档数 (默认: 4)'
+    )
+
+    parser.add_argument(
+        '--log-level',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        default='INFO',
+        help='日志文件记录的最低级别，DEBUG 会记录每张图片、每个路径尝试等细节 (默认: INFO)'
+    )
+
+    parser.add_argument(
+        '--log-mode',
+        choices=['queue', 'sync'],
+        default='queue',
+        help='日志写入模式: queue 由后台线程格式化并写文件，sync 同步写文件 (默认: queue)'
+    )
+
+    parser.add_argument(
+        '--log-format',
+        choices=['text', 'json'],
+        default='text',
+        help='日志文件格式: text 文本，json 结构化 JSON Lines (默认: text)'
+    )
+
+    parser.add_argument(
+        '--log-sample',
+        type=int,
+        default=1,
+        help='热路径日志（逐条目的 INFO/DEBUG 日志）每 N 条保留 1 条 (默认: 1，不采样)'
+    )
+
     args = parser.parse_args()
 
     # 处理 resume 和 no-resume 参数的逻辑
     if args.no_resume:
         args.resume = False
 
+    # 归档只能从头顺序写入，无法在已有归档上接续
+    if args.output_format != 'dir':
+        args.resume = False
+
     return args
 
 
 def main():
     """主函数"""
+    contexts: list[ArchiveContext] = []
+    # 在 try 之外解析命令行参数：--help 或参数错误时直接退出，不执行下面的清理
+    args = parse_arguments()
     try:
-        # 解析命令行参数
-        args = parse_arguments()
+        setup_logging(LOG_DIR, level=args.log_level, mode=args.log_mode,
+                      fmt=args.log_format, sample_every=args.log_sample)
 
-        zim_file_path = SCP_OFFLINE_ZIM_PATH
-        zim = ReadZIM(zim_file_path)
-        zim.read_zim()
+        zim_paths = args.zim or [path for path in SCP_OFFLINE_ZIM_PATH.split(os.pathsep) if path]
+        if args.verify:
+            run_verify(args, zim_paths)
+            return
+        if args.upload_dify:
+            run_upload(args)
+            return
+
+        global output_sink, image_stage, parse_cache, tag_stats, watchdog, memory_profiler, low_memory
+        low_memory = args.low_memory
+        # 输出清单记录每个输出文件的大小和哈希，供 --verify 使用
+        if args.output_format == 'dir':
+            manifest_file = os.path.join(STATE_DIR, 'manifest.json')
+        else:
+            archive_name = os.path.splitext(os.path.basename(args.archive or SCP_MD_OUTPUT_DIR))[0]
+            manifest_file = os.path.join(STATE_DIR, f'manifest-{archive_name}.json')
+        output_sink = create_output_sink(
+            args.output_format, SCP_MD_OUTPUT_DIR, args.archive, args.shard_by_range, manifest_file)
+        tracker.add_summary_section("输出文件", output_sink.stats)
+        tracker.add_summary_section("元数据提取", metadata_report.stats)
+        if args.item_timeout > 0 or args.memory_limit > 0:
+            watchdog = ItemWatchdog(args.item_timeout, args.memory_limit * 1024 * 1024)
+            tracker.add_summary_section("处理预算", watchdog.stats)
+        if args.memory_profile:
+            memory_profiler = MemoryProfiler(args.memory_profile)
+            tracker.add_summary_section("内存占用", memory_profiler.stats)
+        if args.parse_cache_size > 0:
+            parse_cache = ParseCache(os.path.join(args.cache_dir, 'parse-cache'),
+                                     args.parse_cache_size * 1024 * 1024)
+            tracker.add_summary_section("解析缓存", parse_cache.stats)
+        if args.image_format:
+            image_stage = ImageStage(
+                os.path.join(args.cache_dir, 'image-cache'), args.image_format,
+                args.image_quality, args.image_max_size, args.image_workers)
+            tracker.add_summary_section("图片转码", image_stage.stats)
+
+        contexts = open_archives(zim_paths, with_index=not args.no_index)
+        if not args.no_index:
+            tag_stats = TagStats(STATE_DIR, output_sink)
+        if len(contexts) > 1:
+            # 其他归档的图片与主归档同一路径下的图片比较，内容相同时共用主归档的文件
+            primary = contexts[0].zim
+            asset_store.set_primary(
+                lambda path: primary.get_img(path, warn_missing=False),
+                str(primary.archive.uuid) if primary.archive is not None else "")
+            tracker.add_summary_section("图片去重", asset_store.stats)
 
         # 开始处理会话
         tracker.start_session()
@@ -276,109 +970,38 @@ def main():
         # 处理单个 SCP
         if args.single:
             print_info(f"单个处理模式: {args.single}")
-            success = make_obsidian_md(
-                zim, args.single, respect_completed=args.resume)
-            if success:
-                print_info(f"成功处理 {args.single}")
-            else:
-                logger.error(f"[FAILED] 处理失败 {args.single}")
+            for context in contexts:
+                item_key = context.item_key(args.single)
+                success = export_item(
+                    context, args.single, respect_completed=args.resume)
+                if success:
+                    print_info(f"成功处理 {item_key}")
+                else:
+                    logger.error(f"[FAILED] 处理失败 {item_key}")
+            if image_stage is not None:
+                image_stage.drain()
             tracker.print_summary()
             return
 
-        # 确定处理范围
-        start_num = args.start
-        end_num = args.end
-
-        # 断点接续模式
-        if args.resume:
-            start_num = tracker.get_resume_point()
-            print_info(f"断点接续模式: 从 SCP-{start_num:03d} 开始")
+        if len(contexts) == 1:
+            run_batch(contexts[0], args)
         else:
-            # 如果不是断点接续模式，可以选择性地清除已完成列表
-            # 这里我们不自动清除，而是通过不检查已完成列表来实现重新开始
-            print_info(f"重新开始模式: 从 SCP-{start_num:03d} 开始（将重新处理所有项目）")
-
-        # 批量处理
-        print_info(f"开始批量处理SCP文档: SCP-{start_num:03d} 到 SCP-{end_num:03d}")
-        failed_count = 0
-        max_consecutive_failures = args.max_failures
-
-        # 计算总数量和已完成数量用于进度条
-        total_count = end_num - start_num + 1
-        completed_in_range = 0
-
-        # 如果是断点接续，计算已完成的数量
-        if args.resume:
-            for i in range(start_num, end_num + 1):
-                scp_check_id = f"scp-{i:03d}"
-                if tracker.should_skip(scp_check_id, respect_completed=True):
-                    completed_in_range += 1
-
-        # 创建进度条
-        with tqdm(
-            total=total_count,
-            initial=completed_in_range,
-            desc="处理SCP文档",
-            unit="个",
-            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}] {desc}",
-            ncols=100,
-            file=sys.stdout,  # 明确指定输出流
-            leave=True,       # 完成后保留进度条
-            dynamic_ncols=True  # 动态调整宽度
-        ) as pbar:
-
-            for scp_id in scp_num_generator(start_num, end_num):
-                # 提取当前处理的编号
-                current_num = int(scp_id[4:])  # 去掉 "scp-" 前缀
-
-                if failed_count >= max_consecutive_failures:
-                    logger.warning(f"连续失败次数达到 {max_consecutive_failures}，停止处理")
-                    logger.info(f"当前处理到: {scp_id}")
-                    break
-
-                # 检查是否需要跳过
-                if tracker.should_skip(scp_id, respect_completed=args.resume):
-                    pbar.set_description(f"处理SCP文档 [跳过{scp_id}]")
-                    # 对于跳过的项目，如果不是断点接续模式，也需要更新进度条
-                    if not args.resume or completed_in_range == 0:
-                        pbar.update(1)
-                    continue
-
-                success = make_obsidian_md(
-                    zim, scp_id, respect_completed=args.resume)
-
-                # 更新进度条描述
-                if success:
-                    failed_count = 0  # 重置连续失败计数
-                    pbar.set_description(f"处理SCP文档 [✓{scp_id}]")
-                else:
-                    failed_count += 1
-                    pbar.set_description(f"处理SCP文档 [✗{scp_id}]")
-
-                # 保存当前进度（用于断点接续）
-                tracker.save_resume_point(current_num)
-
-                # 更新进度条
-                pbar.update(1)
-
-                # 每处理100个项目打印一次统计
-                if tracker.status_data['current_session']['processed'] % 100 == 0:
-                    # 暂时停止进度条显示统计
-                    pbar.clear()
-                    tracker.print_summary()
-                    pbar.refresh()
-
-                # 每处理10个项目更新进度条后缀信息
-                if tracker.status_data['current_session']['processed'] % 10 == 0:
-                    stats = tracker.get_statistics()
-                    success_rate = stats['success_rate']
-                    pbar.set_postfix({
-                        '成功': stats['current_session']['successful'],
-                        '失败': stats['current_session']['failed'],
-                        '成功率': f"{success_rate:.1f}%"
-                    })
-
-        # 处理完成，打印最终摘要
+            # 每个归档一个处理线程，共用同一个输出目标
+            print_info(f"同时处理 {len(contexts)} 个归档: "
+                       f"{', '.join(context.label or context.language or '主归档' for context in contexts)}")
+            with ThreadPoolExecutor(max_workers=len(contexts)) as pool:
+                batches = [pool.submit(run_batch, context, args, position)
+                           for position, context in enumerate(contexts)]
+                try:
+                    for batch in batches:
+                        batch.result()
+                except KeyboardInterrupt:
+                    stop_event.set()
+                    raise
+
+        # 处理完成，等待图片转码写出后打印最终摘要
+        if image_stage is not None:
+            image_stage.drain()
         tracker.print_summary()
         print_info("处理完成！")
 
@@ -390,6 +1013,7 @@ def main():
             print_info("可以使用 --resume 参数重新运行程序来继续处理")
 
     except KeyboardInterrupt:
+        stop_event.set()
         print_info("用户中断了处理过程")
         print_info("使用 --resume 参数可以从中断点继续处理")
         tracker.print_summary()
@@ -399,6 +1023,23 @@ def main():
     finally:
         # 确保保存最终状态
         tracker.save_status()
+        if watchdog is not None:
+            watchdog.close()
+        if memory_profiler is not None:
+            memory_profiler.close()
+        if image_stage is not None:
+            image_stage.close()
+        for context in contexts:
+            if context.index_notes is not None:
+                # 归档输出中需要包含全部范围的索引笔记
+                context.index_notes.flush(force_all=args.output_format != 'dir')
+        if tag_stats is not None:
+            tag_stats.flush(force=args.output_format != 'dir')
+        metadata_report.save()
+        output_sink.close()
+        if args.output_format == 'dir' and not (args.verify or args.upload_dify):
+            asset_store.save()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -1,38 +1,137 @@
 import libzim
 from libzim.reader import Archive
+from libzim.search import Query, Searcher
+from libzim.suggestion import SuggestionSearcher
+import bisect
+import html
+import itertools
+import json
 import os
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 import urllib.parse
 import logging
-from typing import Optional
+from typing import Iterable, Iterator, Optional
+from bs4 import BeautifulSoup, Tag
+from src.utils.log_tool import HOT
 
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
+
+class _LRUCache:
+    """线程安全的 LRU 缓存"""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# 搜索结果缓存，键中包含归档 UUID，同一归档的多个 ReadZIM 实例共享
+_search_cache = _LRUCache()
+
+# 系列索引页，每页列出一千个 SCP 的编号与标题
+SERIES_HUB_PAGES = ["scp-series"] + [f"scp-series-{i}" for i in range(2, 11)]
+
+# 索引页中指向 SCP 条目的链接，如 "/scp-173"
+_SCP_HREF_PATTERN = re.compile(r'(?:^|/)scp-(\d+)$')
+
+
+# 正文区域的起始位置，以及其中的第一张图片（与 SCPHtmlProcessor.extract_image_sources 一致，只取第一张）
+_PAGE_CONTENT_PATTERN = re.compile(r'id\s*=\s*["\']page-content["\']')
+_IMG_SRC_PATTERN = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+@dataclass
+class PrefetchedContent:
+    """预读的页面内容和图片"""
+    path: str
+    content: Optional[str]
+    # 图片源路径（去除 "../" 前缀后）-> 图片数据，只包含推测会用到的图片；
+    # ZIM 中不存在的图片为 None，调用方不必再次查找
+    images: dict[str, Optional[bytes]] = field(default_factory=dict)
+
+
 class ReadZIM:
     def __init__(self, file_path) -> None:
         self.zim_file_path = file_path
         self.archive: Optional[Archive] = None
+        # 没有搜索索引时使用的标题索引，首次搜索时建立
+        self._title_index: Optional[tuple[list[str], list[str]]] = None
+        # 多个处理线程可能同时搜索，标题索引只建立一次
+        self._title_index_lock = threading.Lock()
+        # SCP 编号 -> 标题，由 load_title_map 加载
+        self.title_map: dict[int, str] = {}
 
     def get_content(self,path)->str|None:
         if self.archive is not None:
             res_path = f"{self.archive.main_entry.get_item().path}{path}"
-            return self.archive.get_entry_by_path(res_path).get_item().content.tobytes().decode('utf-8', errors='ignore')
+            try:
+                entry = self.archive.get_entry_by_path(res_path)
+            except KeyError:
+                # ZIM 中没有该条目
+                return None
+            return entry.get_item().content.tobytes().decode('utf-8', errors='ignore')
         else:
             return None
-    def get_img(self, path) -> bytes | None:
+    def get_size(self, path) -> int:
+        """返回页面内容的字节数，不存在时返回 0，用作处理耗时的估计"""
+        if self.archive is None:
+            return 0
+        try:
+            entry = self.archive.get_entry_by_path(f"{self.archive.main_entry.get_item().path}{path}")
+        except KeyError:
+            return 0
+        return entry.get_item().size
+
+    def has_content(self, path) -> bool:
+        """检查 ZIM 中是否存在某个页面，不读取内容"""
+        if self.archive is None:
+            return False
+        return self.archive.has_entry_by_path(f"{self.archive.main_entry.get_item().path}{path}")
+
+    def get_language(self) -> str:
+        """获取 ZIM 元数据中的语言代码，如 zho、eng"""
+        if self.archive is None:
+            return ""
+        try:
+            return self.archive.get_metadata("Language").decode('utf-8').split(',')[0].strip()
+        except Exception:
+            return ""
+
+    def get_img(self, path, warn_missing: bool = True) -> bytes | None:
         """
         从ZIM文件中提取图片并返回字节数据
         
         Args:
             path: 图片在ZIM文件中的路径
+            warn_missing: 图片不存在时是否记录警告
             
         Returns:
             bytes: 图片的字节数据，如果失败返回None
         """
         if self.archive is not None:
             try:
-                logger.debug(f"提取图片: {path}")
+                logger.debug("提取图片: %s", path, extra=HOT)
                 
                 # 尝试多种路径格式
                 paths_to_try = [
@@ -43,65 +142,278 @@ class ReadZIM:
                 
                 for try_path in paths_to_try:
                     try:
-                        logger.debug(f"尝试路径: {try_path}")
+                        logger.debug("尝试路径: %s", try_path, extra=HOT)
                         # 获取图片二进制数据
                         entry = self.archive.get_entry_by_path(try_path)
                         item = entry.get_item()
                         image_data = item.content.tobytes()
                         
-                        logger.debug(f"图片提取成功，大小: {len(image_data)} 字节")
+                        logger.debug("图片提取成功，大小: %d 字节", len(image_data), extra=HOT)
                         return image_data
                     except Exception as inner_e:
-                        logger.debug(f"路径 {try_path} 失败: {inner_e}")
+                        logger.debug("路径 %s 失败: %s", try_path, inner_e, extra=HOT)
                         continue
                 
-                logger.warning(f"所有路径尝试都失败了: {path}")
+                if warn_missing:
+                    logger.warning("所有路径尝试都失败了: %s", path)
                 return None
                 
             except Exception as e:
-                logger.error(f"提取图片失败: {path} - {e}")
+                logger.error("提取图片失败: %s - %s", path, e)
                 return None
         else:
             logger.error("ZIM文件未加载")
             return None
     
-    def search_entries(self, keyword: str, max_results: int = 10) -> list[str]:
+    def _guess_first_image(self, content: str) -> Optional[str]:
+        """不解析 HTML，推测正文中第一张图片的路径"""
+        match = _PAGE_CONTENT_PATTERN.search(content)
+        if match is None:
+            return None
+        match = _IMG_SRC_PATTERN.search(content, match.end())
+        if match is None:
+            return None
+        src = html.unescape(match.group(1))
+        for prefix in ('../', './'):
+            if src.startswith(prefix):
+                return src[len(prefix):]
+        return src
+
+    def _prefetch(self, path: str, with_images: bool) -> PrefetchedContent:
+        content = self.get_content(path)
+        result = PrefetchedContent(path, content)
+        if with_images and content:
+            src = self._guess_first_image(content)
+            if src:
+                result.images[src] = self.get_img(src)
+        return result
+
+    def iter_contents(self, paths: Iterable[str], prefetch: int = 4, with_images: bool = True,
+                      workers: Optional[int] = None) -> Iterator[PrefetchedContent]:
+        """
+        按顺序返回多个页面的内容，同时在后台线程中预读之后的页面
+
+        调用方处理当前页面时，后面最多 prefetch 个页面（及其第一张图片）已经在读取和解压，
+        内存中最多同时保留 prefetch + 1 个页面。
+
+        Args:
+            paths: 页面路径，如 "scp-173"
+            prefetch: 预读的页面数，0 表示不预读
+            with_images: 是否同时预读正文中的第一张图片（按原始 HTML 推测，推测错误时调用方需自行读取）
+            workers: 预读线程数，默认为 min(prefetch, 4)
+
+        Yields:
+            PrefetchedContent: 与 paths 顺序相同的页面内容，页面不存在时 content 为 None
+        """
+        if prefetch <= 0:
+            for path in paths:
+                yield self._prefetch(path, with_images)
+            return
+
+        remaining = iter(paths)
+        executor = ThreadPoolExecutor(max_workers=workers or min(prefetch, 4),
+                                      thread_name_prefix="zim-prefetch")
+        window: deque = deque()
+        try:
+            for path in itertools.islice(remaining, prefetch):
+                window.append(executor.submit(self._prefetch, path, with_images))
+            while window:
+                result = window.popleft().result()
+                # 先提交下一个页面再返回当前页面，预读与调用方的处理同时进行
+                for path in itertools.islice(remaining, 1):
+                    window.append(executor.submit(self._prefetch, path, with_images))
+                yield result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def search_entries(self, keyword: str, max_results: int = 10, offset: int = 0,
+                       mode: str = "auto") -> list[str]:
         """
         搜索ZIM文件中包含关键字的条目
-        
+
+        ZIM 带有全文索引时使用 libzim 的全文搜索；按标题搜索时使用标题索引
+        （SuggestionSearcher）；两者都没有时退回到由条目列表建立的标题索引。
+        查询结果按 (归档 UUID, 查询参数) 缓存。
+
         Args:
             keyword: 搜索关键字
             max_results: 最大返回结果数
-            
+            offset: 结果偏移量，用于分页
+            mode: "auto" 优先全文搜索；"fulltext" 全文搜索；"title" 标题前缀搜索
+
         Returns:
             list[str]: 匹配的条目路径列表
         """
-        if not self.archive:
+        if not self.archive or not keyword:
             return []
-        
-        matching_entries = []
+
+        if mode == "auto":
+            mode = "fulltext" if self.archive.has_fulltext_index else "title"
+
+        cache_key = (str(self.archive.uuid), mode, keyword, offset, max_results)
+        cached = _search_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        matching_entries: list[str] = []
         try:
-            # 使用libzim的搜索功能
-            logger.info(f"搜索包含 '{keyword}' 的条目...")
-            
-            # 尝试几种可能的搜索模式
-            search_patterns = [
+            logger.info("搜索包含 '%s' 的条目...", keyword)
+
+            # 尝试几种可能的搜索模式，直到有结果为止
+            search_patterns = dict.fromkeys([
                 keyword,
                 keyword.replace('%', ''),  # 移除%符号
                 urllib.parse.unquote(keyword),  # URL解码
-            ]
-            
+            ])
+
             for pattern in search_patterns:
-                logger.debug(f"搜索模式: {pattern}")
-                # 这里只是一个简单的实现，实际的libzim可能有不同的API
-                # 可以根据实际的libzim版本调整
-                break
-                
+                if not pattern:
+                    continue
+                logger.debug("搜索模式: %s", pattern)
+                if mode == "fulltext" and self.archive.has_fulltext_index:
+                    search = Searcher(self.archive).search(Query().set_query(pattern))
+                    matching_entries = list(search.getResults(offset, max_results))
+                elif self.archive.has_title_index:
+                    suggestion = SuggestionSearcher(self.archive).suggest(pattern)
+                    matching_entries = list(suggestion.getResults(offset, max_results))
+                else:
+                    matching_entries = self._search_title_index(pattern, max_results, offset)
+                if matching_entries:
+                    break
+
         except Exception as e:
             logger.error(f"搜索条目时出错: {e}")
-        
+            return []
+
+        _search_cache.put(cache_key, tuple(matching_entries))
         return matching_entries
-        
+
+    def _search_title_index(self, keyword: str, max_results: int, offset: int) -> list[str]:
+        """
+        在条目列表建立的标题索引中搜索，先按标题前缀匹配，没有结果时按子串匹配
+
+        Args:
+            keyword: 搜索关键字
+            max_results: 最大返回结果数
+            offset: 结果偏移量
+
+        Returns:
+            list[str]: 匹配的条目路径列表
+        """
+        if self._title_index is None:
+            with self._title_index_lock:
+                if self._title_index is None:
+                    self._title_index = self._build_title_index()
+        titles, paths = self._title_index
+
+        needle = keyword.casefold()
+        start = bisect.bisect_left(titles, needle)
+        end = start
+        while end < len(titles) and titles[end].startswith(needle):
+            end += 1
+        if end > start:
+            return paths[start + offset:min(end, start + offset + max_results)]
+
+        matches = [path for title, path in zip(titles, paths) if needle in title]
+        return matches[offset:offset + max_results]
+
+    def _build_title_index(self) -> tuple[list[str], list[str]]:
+        """遍历全部条目一次，建立按标题排序的 (标题列表, 路径列表)"""
+        if self.archive is None:
+            return [], []
+        logger.info("ZIM文件没有搜索索引，正在建立标题索引...")
+        # python-libzim 没有公开的按编号遍历条目的方法（截至 3.13 只有 _get_entry_by_id），
+        # 有公开方法时优先使用
+        get_entry_by_id = getattr(self.archive, 'get_entry_by_id', None) or self.archive._get_entry_by_id
+        pairs = []
+        for entry_id in range(self.archive.entry_count):
+            entry = get_entry_by_id(entry_id)
+            title = entry.title or entry.path
+            pairs.append((title.casefold(), entry.path))
+        pairs.sort()
+        logger.info("标题索引建立完成: %d 个条目", len(pairs))
+        return [title for title, _ in pairs], [path for _, path in pairs]
+
+    def load_title_map(self, cache_dir: Optional[str] = None) -> dict[int, str]:
+        """
+        加载 SCP 编号 -> 标题表
+
+        首次加载时解析各系列索引页，结果以归档 UUID 命名保存到 cache_dir，
+        之后直接读取缓存文件，不再解析索引页。
+
+        Args:
+            cache_dir: 缓存目录，为 None 时不缓存
+
+        Returns:
+            dict[int, str]: 编号到标题的映射
+        """
+        if self.archive is None:
+            return {}
+
+        cache_file = None
+        if cache_dir:
+            cache_file = os.path.join(cache_dir, f"titles-{self.archive.uuid}.json")
+            if os.path.exists(cache_file):
+                try:
+                    with open(cache_file, 'r', encoding='utf-8') as f:
+                        self.title_map = {int(num): title for num, title in json.load(f).items()}
+                    logger.info("已加载标题表: %d 个条目", len(self.title_map))
+                    return self.title_map
+                except Exception as e:
+                    logger.warning(f"加载标题表失败，将重新解析索引页: {e}")
+
+        self.title_map = self._parse_series_hubs()
+        logger.info("已解析系列索引页: %d 个标题", len(self.title_map))
+
+        if cache_file:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_file = f"{cache_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({str(num): title for num, title in sorted(self.title_map.items())},
+                          f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+        return self.title_map
+
+    def _parse_series_hubs(self) -> dict[int, str]:
+        """解析各系列索引页中形如 "<li><a href="/scp-173">SCP-173</a> - 雕像</li>" 的条目"""
+        titles: dict[int, str] = {}
+        for hub in SERIES_HUB_PAGES:
+            content = self.get_content(hub)
+            if not content:
+                logger.debug("没有系列索引页: %s", hub)
+                continue
+
+            soup = BeautifulSoup(content, 'html.parser')
+            root = soup.find('div', id='page-content') or soup
+            for li in root.find_all('li'):
+                link = li.find('a', href=True)
+                if not isinstance(link, Tag):
+                    continue
+                match = _SCP_HREF_PATTERN.search(str(link['href']))
+                if not match:
+                    continue
+                text = li.get_text().replace('\xa0', ' ')
+                _, sep, title = text.partition(' - ')
+                if sep and title.strip():
+                    titles.setdefault(int(match.group(1)), title.strip())
+            soup.decompose()
+        return titles
+
+    def get_title(self, scp_id: str) -> str:
+        """
+        获取 SCP 的标题
+
+        Args:
+            scp_id: SCP 编号，如 "scp-173"
+
+        Returns:
+            str: 标题，未知时返回空字符串
+        """
+        try:
+            return self.title_map.get(int(scp_id[4:]), "")
+        except ValueError:
+            return ""
+
     def read_zim(self):
         """读取ZIM文件并输出目录结构"""
         try:
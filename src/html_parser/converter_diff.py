@@ -0,0 +1,242 @@
+"""
+转换器差异对比
+用两种转换配置处理同一批页面（ZIM 中的条目或保存为 HTML 文件的黄金语料），
+比较 page_content、page_tags 和提取的图片列表，并报告每种配置的耗时。
+只有输出完全一致且更快的配置才应该被采用。
+
+用法:
+    python -m src.html_parser.converter_diff --sample 200
+    python -m src.html_parser.converter_diff --html-dir golden/ --candidate lxml
+"""
+
+import argparse
+import difflib
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+from src.html_parser.html_processor import SCPHtmlProcessor
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConverterConfig:
+    """一种转换配置"""
+    name: str
+    description: str
+    processor_class: type
+    # 依赖的可选模块，未安装时该配置不可用
+    requires: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return self.requires is None or importlib.util.find_spec(self.requires) is not None
+
+
+def _variant(name: str, **attributes) -> type:
+    """创建覆盖了类属性的 SCPHtmlProcessor 子类"""
+    return type(f"SCPHtmlProcessor[{name}]", (SCPHtmlProcessor,), attributes)
+
+
+CONFIGS: Dict[str, ConverterConfig] = {
+    config.name: config for config in [
+        ConverterConfig("baseline", "当前配置: html.parser，序列化后由 markdownify 重新解析",
+                        SCPHtmlProcessor),
+        ConverterConfig("convert-soup", "直接转换正文解析树，不重新解析",
+                        _variant("convert-soup", convert_from_soup=True)),
+        ConverterConfig("lxml", "使用 lxml 解析器", _variant("lxml", parser='lxml'), requires="lxml"),
+        ConverterConfig("lxml-convert-soup", "lxml 解析器 + 直接转换正文解析树",
+                        _variant("lxml-convert-soup", parser='lxml', convert_from_soup=True),
+                        requires="lxml"),
+    ]
+}
+
+
+def iter_html_dir(html_dir: str) -> Iterator[tuple[str, str]]:
+    """读取目录中的 .html 文件，返回 (名称, HTML)"""
+    for name in sorted(os.listdir(html_dir)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(html_dir, name), 'r', encoding='utf-8') as f:
+                yield name, f.read()
+
+
+def iter_zim_pages(zim_path: str, start: int, end: int, sample: int, seed: int) -> Iterator[tuple[str, str]]:
+    """从 ZIM 中读取 SCP 条目，sample 大于 0 时随机抽样"""
+    from src.handle_zim.readzim import ReadZIM
+
+    zim = ReadZIM(zim_path)
+    zim.read_zim()
+    scp_ids = [f"scp-{i:03d}" for i in range(start, end + 1)]
+    if 0 < sample < len(scp_ids):
+        scp_ids = sorted(random.Random(seed).sample(scp_ids, sample),
+                         key=lambda scp_id: int(scp_id[4:]))
+    for scp_id in scp_ids:
+        content = zim.get_content(scp_id)
+        if content:
+            yield scp_id, content
+
+
+def _run(config: ConverterConfig, html: str) -> tuple[Optional[dict], float]:
+    """用一种配置处理页面，返回 (输出, 耗时)"""
+    started = time.perf_counter()
+    try:
+        processor = config.processor_class(html, convert=True)
+        output = {
+            "page_content": processor.page_content,
+            "page_tags": processor.page_tags,
+            "images": processor.extract_image_sources(),
+        }
+    except ValueError:
+        output = None
+    return output, time.perf_counter() - started
+
+
+def _diff(name: str, field: str, expected, actual, context_lines: int) -> str:
+    """生成一个字段的差异"""
+    if isinstance(expected, str):
+        expected_lines, actual_lines = expected.splitlines(), actual.splitlines()
+    else:
+        expected_lines = [json.dumps(v, ensure_ascii=False) for v in expected]
+        actual_lines = [json.dumps(v, ensure_ascii=False) for v in actual]
+    diff = difflib.unified_diff(expected_lines, actual_lines, f"{name}:{field} (baseline)",
+                                f"{name}:{field} (candidate)", n=2, lineterm='')
+    lines = list(diff)
+    if len(lines) > context_lines:
+        lines = lines[:context_lines] + [f"... 另有 {len(lines) - context_lines} 行差异"]
+    return "\n".join(lines)
+
+
+def compare(pages: Iterator[tuple[str, str]], baseline: ConverterConfig,
+            candidate: ConverterConfig, repeat: int = 1) -> dict:
+    """
+    用两种配置处理所有页面并比较输出
+
+    Args:
+        pages: (名称, HTML) 迭代器
+        baseline: 基准配置
+        candidate: 待比较的配置
+        repeat: 每个页面重复计时的次数，取最短耗时
+
+    Returns:
+        dict: {"pages": 页面数, "timings": {配置名: 总耗时}, "mismatches": [{"page", "fields"}]}
+    """
+    timings = {baseline.name: 0.0, candidate.name: 0.0}
+    mismatches = []
+    count = 0
+    for name, html in pages:
+        count += 1
+        outputs = {}
+        # 交替先后顺序，避免缓存对某一种配置有利
+        order = [baseline, candidate] if count % 2 else [candidate, baseline]
+        for config in order:
+            best = float('inf')
+            for _ in range(max(1, repeat)):
+                output, elapsed = _run(config, html)
+                best = min(best, elapsed)
+            outputs[config.name] = output
+            timings[config.name] += best
+
+        expected, actual = outputs[baseline.name], outputs[candidate.name]
+        if expected is None or actual is None:
+            if (expected is None) != (actual is None):
+                mismatches.append({"page": name, "fields": {"processor": "只有一种配置处理失败"}})
+            continue
+        fields = {field: (expected[field], actual[field])
+                  for field in expected if expected[field] != actual[field]}
+        if fields:
+            mismatches.append({"page": name, "fields": fields})
+    return {"pages": count, "timings": timings, "mismatches": mismatches}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="对比两种转换配置的输出和速度")
+    parser.add_argument('--baseline', choices=list(CONFIGS), default='baseline',
+                        help='基准配置 (默认: baseline)')
+    parser.add_argument('--candidate', choices=list(CONFIGS), default='convert-soup',
+                        help='待比较的配置 (默认: convert-soup)')
+    parser.add_argument('--html-dir', help='黄金语料目录（.html 文件），指定时不读取 ZIM')
+    parser.add_argument('--zim', help='ZIM 文件路径 (默认: SCP_OFFLINE_ZIM_PATH 中的第一个)')
+    parser.add_argument('--start', type=int, default=1, help='开始编号 (默认: 1)')
+    parser.add_argument('--end', type=int, default=10000, help='结束编号 (默认: 10000)')
+    parser.add_argument('--sample', type=int, default=200, help='随机抽取的条目数，0 表示全部 (默认: 200)')
+    parser.add_argument('--seed', type=int, default=0, help='抽样随机种子 (默认: 0)')
+    parser.add_argument('--repeat', type=int, default=1, help='每个页面重复计时次数，取最短 (默认: 1)')
+    parser.add_argument('--show', type=int, default=5, help='显示差异的页面数 (默认: 5)')
+    parser.add_argument('--report', help='将完整结果写入 JSON 文件')
+    parser.add_argument('--list', action='store_true', help='列出所有配置')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    if args.list:
+        for config in CONFIGS.values():
+            state = "" if config.available else f"（需要安装 {config.requires}）"
+            print(f"{config.name:20} {config.description}{state}")
+        return 0
+
+    baseline, candidate = CONFIGS[args.baseline], CONFIGS[args.candidate]
+    for config in (baseline, candidate):
+        if not config.available:
+            print(f"配置 {config.name} 不可用，需要安装 {config.requires}", file=sys.stderr)
+            return 2
+
+    if args.html_dir:
+        pages = iter_html_dir(args.html_dir)
+    else:
+        zim_path = args.zim or (os.getenv("SCP_OFFLINE_ZIM_PATH") or "").split(os.pathsep)[0]
+        if not zim_path:
+            print("请指定 --html-dir 或 --zim，或设置环境变量 SCP_OFFLINE_ZIM_PATH", file=sys.stderr)
+            return 2
+        pages = iter_zim_pages(zim_path, args.start, args.end, args.sample, args.seed)
+
+    result = compare(pages, baseline, candidate, args.repeat)
+
+    for mismatch in result["mismatches"][:args.show]:
+        print(f"=== {mismatch['page']}")
+        for field, values in mismatch["fields"].items():
+            if isinstance(values, tuple):
+                print(_diff(mismatch["page"], field, *values, context_lines=40))
+            else:
+                print(f"{field}: {values}")
+
+    pages_count = max(1, result["pages"])
+    base_time = result["timings"][baseline.name]
+    candidate_time = result["timings"][candidate.name]
+    print(f"页面数: {result['pages']}，不一致: {len(result['mismatches'])}")
+    for name, total in result["timings"].items():
+        print(f"  {name:20} 总耗时 {total:.3f} 秒，平均 {total / pages_count * 1000:.2f} 毫秒/页")
+    if candidate_time > 0:
+        print(f"  加速比: {base_time / candidate_time:.2f}x")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({
+                "baseline": baseline.name,
+                "candidate": candidate.name,
+                "pages": result["pages"],
+                "timings": result["timings"],
+                "mismatches": [
+                    {"page": m["page"], "fields": {
+                        field: {"baseline": v[0], "candidate": v[1]} if isinstance(v, tuple) else v
+                        for field, v in m["fields"].items()}}
+                    for m in result["mismatches"]
+                ],
+            }, f, ensure_ascii=False, indent=2)
+
+    # 有差异时返回非零，便于在脚本中使用
+    return 1 if result["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,56 +3,169 @@ HTML 内容处理器
 使用 BeautifulSoup 处理 SCP Wiki 的 HTML 内容，提取正文部分
 """
 
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, NavigableString, Tag
 import logging
-from typing import Optional, Dict, List, Union
-from src.html_parser.md_br_coverter import md_keep_br
+import urllib.parse
+from typing import Any, Optional, Dict, List, Union
+from src.html_parser.md_br_coverter import md_keep_br, md_keep_br_soup
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
+# HTML 清理器版本，修改 _remove_unwanted_elements、正文/标题/标签/图片的提取逻辑后需要加一，
+# 使解析缓存中的旧结果失效
+CLEANER_VERSION = 1
+
+# markdownify 转换参数
+MARKDOWN_OPTIONS = {
+    "heading_style": "ATX",
+    "default_title": True,
+    "escape_underscores": False,
+}
+
 
 class SCPHtmlProcessor:
     """SCP HTML 内容处理器"""
 
-    def __init__(self, content: str):
+    # BeautifulSoup 使用的解析器
+    parser = 'html.parser'
+    # 是否直接转换正文的解析树（不先序列化为字符串再由 markdownify 重新解析），
+    # 启用前先用 converter_diff 确认输出一致
+    convert_from_soup = False
+
+    def __init__(self, content: str, convert: bool = True, low_memory: bool = False):
         """
         初始化处理器
 
         Args:
             content: HTML 内容字符串
+            convert: 是否立即转换为 Markdown；为 False 时可以先调用 rewrite_links
+                改写链接，再调用 convert_to_markdown
+            low_memory: 低内存模式，提取完正文、标题和标签后立即释放整页的解析树，
+                转换为 Markdown 后释放正文的解析树
         """
+        self.low_memory = low_memory
         self.page_content: str = ""
         self.page_content_div: Optional[Tag] = None
         self.page_tags: list[str] = []
+        self.raw_tags: list[str] = []
+        self.page_title: str = ""
         self.soup: Optional[BeautifulSoup] = None
-        if not self._process_html(content):
+        self._cached_images: Optional[list[str]] = None
+        if not self._process_html(content, convert):
             logger.error("HTML文档处理失败")
             raise ValueError("获取文档失败")
 
-    def _process_html(self, html_content: str) -> bool:
+    def _process_html(self, html_content: str, convert: bool = True) -> bool:
         '''
         处理HTML内容，移除不需要的元素并提取正文和标签
         Returns:
             bool: 处理是否成功
         '''
         try:
-            self.soup = BeautifulSoup(html_content, 'html.parser')
+            self.soup = BeautifulSoup(html_content, self.parser)
 
+            self.page_title = self._extract_title()
             self._remove_unwanted_elements()
             self.page_content_div = self._extract_content()
             if self.page_content_div is None:
                 logger.error("未找到页面内容区域")
                 return False
-            if self._html_to_markdown(str(self.page_content_div)) == False:
-                logger.error("HTML转Markdown失败")
+            self.raw_tags = self._extract_tags()
+            self.page_tags = format_obsidian_tags(self.raw_tags)
+            if self.low_memory:
+                self._release_page()
+            if convert and not self.convert_to_markdown():
                 return False
-            self.page_tags = self._extract_and_convert_tags()
             return True
 
         except Exception as e:
             logger.error(f"处理HTML内容时发生错误: {e}")
             return False
 
+    def to_cache_entry(self) -> Dict[str, Any]:
+        """
+        返回可写入解析缓存的清理结果，需在 rewrite_links 之前调用
+
+        Returns:
+            Dict[str, Any]: 清理后的正文 HTML、标题、图片和原始标签列表
+        """
+        return {
+            "html": str(self.page_content_div),
+            "title": self.page_title,
+            "images": self.extract_image_sources(),
+            "tags": self.raw_tags,
+        }
+
+    @classmethod
+    def from_cache_entry(cls, entry: Dict[str, Any], low_memory: bool = False) -> "SCPHtmlProcessor":
+        """
+        从解析缓存恢复处理器，只解析清理后的正文，不再执行整页的清理和提取
+
+        Args:
+            entry: to_cache_entry 返回的结果
+            low_memory: 低内存模式，见 __init__
+
+        Returns:
+            SCPHtmlProcessor: 尚未转换为 Markdown 的处理器
+        """
+        processor = cls.__new__(cls)
+        processor.low_memory = low_memory
+        processor.page_content = ""
+        processor.page_title = entry["title"]
+        processor.raw_tags = list(entry["tags"])
+        processor.page_tags = format_obsidian_tags(processor.raw_tags)
+        processor._cached_images = list(entry["images"])
+        processor.soup = BeautifulSoup(entry["html"], cls.parser)
+        processor.page_content_div = processor._extract_content()
+        if processor.page_content_div is None:
+            raise ValueError("解析缓存中没有页面内容")
+        return processor
+
+    def convert_to_markdown(self) -> bool:
+        """
+        将正文转换为 Markdown，结果保存在 page_content
+
+        Returns:
+            bool: 转换是否成功
+        """
+        if self.page_content_div is None:
+            logger.error("页面内容为空，无法转换")
+            return False
+        if self.convert_from_soup:
+            try:
+                self.page_content = md_keep_br_soup(self.page_content_div, **MARKDOWN_OPTIONS)
+            except Exception as e:
+                logger.error(f"转换HTML为Markdown时发生错误: {e}")
+                return False
+        elif self._html_to_markdown(str(self.page_content_div)) == False:
+            logger.error("HTML转Markdown失败")
+            return False
+        if self.low_memory:
+            self.release()
+        return True
+
+    def _release_page(self):
+        """
+        把正文从整页的解析树中取出，释放其余部分
+
+        解析树中的节点互相引用（parent/next_element 等），不调用 decompose 时
+        只能等循环垃圾回收释放，大页面会在内存中停留很久
+        """
+        if self.soup is None or self.page_content_div is None:
+            return
+        self.page_content_div.extract()
+        self.soup.decompose()
+        self.soup = None
+
+    def release(self):
+        """释放所有解析树，之后只保留 page_content、标题和标签"""
+        if self.page_content_div is not None:
+            self.page_content_div.decompose()
+            self.page_content_div = None
+        if self.soup is not None:
+            self.soup.decompose()
+            self.soup = None
+
     def _html_to_markdown(self, html: str) -> bool:
         """
         将HTML内容转换为Markdown格式
@@ -69,13 +182,7 @@ class SCPHtmlProcessor:
 
             
             # 使用markdownify转换，配置参数以更好地处理换行和空白
-            self.page_content = md_keep_br(
-                html, 
-                heading_style="ATX",
-                
-                default_title=True,
-                escape_underscores=False
-            )
+            self.page_content = md_keep_br(html, **MARKDOWN_OPTIONS)
             return True
         except Exception as e:
             logger.error(f"转换HTML为Markdown时发生错误: {e}")
@@ -100,12 +207,27 @@ class SCPHtmlProcessor:
             logger.error("soup对象为空，无法提取内容")
             return None
 
-    def _extract_and_convert_tags(self) -> list[str]:
+    def _extract_title(self) -> str:
+        '''
+        提取页面标题
+        Returns:
+            str: 页面标题，未找到时返回空字符串
+        '''
+        if not self.soup:
+            return ""
+        title_div = self.soup.find('div', id='page-title')
+        if title_div and isinstance(title_div, Tag):
+            return title_div.get_text(strip=True)
+        if self.soup.title and self.soup.title.string:
+            return self.soup.title.string.strip()
+        return ""
+
+    def _extract_tags(self) -> list[str]:
         """
-        提取页面标签并转换为 Obsidian 格式
+        提取页面标签
 
         Returns:
-            list[str]: 转换后的 Obsidian 标签列表
+            list[str]: 页面中的原始标签文本
         """
         if not self.soup:
             logger.warning("soup对象为空，无法提取标签")
@@ -119,18 +241,16 @@ class SCPHtmlProcessor:
 
         # 提取所有标签链接
         tag_links = tags_div.find_all('a')
-        obsidian_tags = []
+        tags = []
 
         for link in tag_links:
             if isinstance(link, Tag):
                 tag_text = link.get_text(strip=True)
                 if tag_text:
-                    # 转换为 Obsidian 标签格式
-                    obsidian_tag = f"#{tag_text}"
-                    obsidian_tags.append(obsidian_tag)
+                    tags.append(tag_text)
 
-        logger.debug(f"提取到 {len(obsidian_tags)} 个标签: {obsidian_tags}")
-        return obsidian_tags
+        logger.debug("提取到 %d 个标签: %s", len(tags), tags)
+        return tags
 
     def _remove_unwanted_elements(self):
         """移除不需要的HTML元素"""
@@ -174,6 +294,8 @@ class SCPHtmlProcessor:
 
     def extract_image_sources(self) -> list[str]:
         """提取图片源路径，不修改HTML结构"""
+        if self._cached_images is not None:
+            return list(self._cached_images)
         if not self.page_content_div:
             logger.warning("页面内容为空，无法提取图片")
             return []
@@ -189,42 +311,121 @@ class SCPHtmlProcessor:
                 src = img.get('src')
                 if src and isinstance(src, str):  # 确保src是字符串
                     # 清理路径，去除相对路径前缀
-                    clean_src = src
-                    if src.startswith('../'):
-                        clean_src = src[3:]  # 移除 "../"
-                    elif src.startswith('./'):
-                        clean_src = src[2:]  # 移除 "./"
+                    clean_src = _clean_relative_path(src)
                     img_srcs.append(clean_src)
-                    logger.debug(f"找到图片: {clean_src}")
+                    logger.debug("找到图片: %s", clean_src)
                 # 只拿第一个图片
                 break
 
-        logger.debug(f"共找到 {len(img_srcs)} 个图片")
+        logger.debug("共找到 %d 个图片", len(img_srcs))
         return img_srcs
 
-    def update_image_paths(self, old_src: str, new_src: str) -> None:
-        """更新图片路径"""
-        if not self.page_content_div:
-            logger.warning("页面内容为空，无法更新图片路径")
-            return
+    def rewrite_links(self, image_map: Dict[str, str], article_map: Dict[str, str]) -> Dict[str, int]:
+        """
+        一次遍历正文，改写图片路径和站内条目链接，需在 convert_to_markdown 之前调用
 
-        if isinstance(self.page_content_div, Tag):
-            img_tags = self.page_content_div.find_all('img')
-            for img in img_tags:
-                if isinstance(img, Tag):
-                    src = img.get('src')
-                    if src and isinstance(src, str):
-                        # 检查是否匹配原始路径
-                        clean_src = src
-                        if src.startswith('../'):
-                            clean_src = src[3:]
-                        elif src.startswith('./'):
-                            clean_src = src[2:]
-
-                        if clean_src == old_src:
-                            img['src'] = new_src
-                            logger.debug(f"更新图片路径: {old_src} -> {new_src}")
-                            break
+        Args:
+            image_map: 图片源路径（去除 "../" 前缀后）-> 笔记中使用的图片路径
+            article_map: 页面名（如 "scp-173"）-> 库中的笔记名，链接改写为 [[笔记名]]
+
+        Returns:
+            Dict[str, int]: 改写和无法解析的图片、链接数量
+        """
+        stats = {
+            "images_rewritten": 0,
+            "images_unresolved": 0,
+            "links_rewritten": 0,
+            "links_unresolved": 0,
+        }
+        if not isinstance(self.page_content_div, Tag):
+            logger.warning("页面内容为空，无法改写链接")
+            return stats
+
+        for element in self.page_content_div.find_all(['img', 'a']):
+            if not isinstance(element, Tag):
+                continue
+
+            if element.name == 'img':
+                src = element.get('src')
+                if not src or not isinstance(src, str):
+                    continue
+                new_src = image_map.get(_clean_relative_path(src))
+                if new_src is None:
+                    stats["images_unresolved"] += 1
+                else:
+                    element['src'] = new_src
+                    stats["images_rewritten"] += 1
+                continue
+
+            href = element.get('href')
+            if not href or not isinstance(href, str):
+                continue
+            page_name = _internal_page_name(href)
+            if page_name is None:
+                continue
+            target = article_map.get(page_name)
+            if target is None:
+                stats["links_unresolved"] += 1
+                continue
+
+            text = element.get_text(strip=True).replace('|', ' ').replace(']', ' ')
+            # 表格中的 "|" 需要转义，否则会被当作单元格分隔符
+            separator = '\\|' if element.find_parent('table') else '|'
+            if text and text.lower() != target.lower():
+                element.replace_with(NavigableString(f"[[{target}{separator}{text}]]"))
+            else:
+                element.replace_with(NavigableString(f"[[{target}]]"))
+            stats["links_rewritten"] += 1
+
+        logger.debug("链接改写结果: %s", stats)
+        return stats
+
+
+def format_obsidian_tags(tags: list[str]) -> list[str]:
+    """
+    将页面标签转换为 Obsidian 标签格式
+
+    Args:
+        tags: 原始标签文本
+
+    Returns:
+        list[str]: 如 ["#safe", "#scp"]
+    """
+    return [f"#{tag}" for tag in tags]
+
+
+def _clean_relative_path(src: str) -> str:
+    """清理路径，去除相对路径前缀"""
+    if src.startswith('../'):
+        return src[3:]
+    if src.startswith('./'):
+        return src[2:]
+    return src
+
+
+def _internal_page_name(href: str) -> Optional[str]:
+    """
+    获取站内链接指向的页面名
+
+    Args:
+        href: 链接地址，如 "scp-173"、"../scp-wiki-cn.wikidot.com/scp-173"、
+            "http://scp-wiki-cn.wikidot.com/scp-173"
+
+    Returns:
+        Optional[str]: 小写的页面名，非站内链接返回 None
+    """
+    parsed = urllib.parse.urlparse(href)
+    if parsed.scheme and parsed.scheme not in ('http', 'https'):
+        return None
+    if parsed.netloc and not parsed.netloc.endswith('wikidot.com'):
+        return None
+    segments = [segment for segment in parsed.path.split('/') if segment not in ('', '.', '..')]
+    # ZIM 内的相对路径以站点域名开头
+    if segments and not parsed.netloc and segments[0].endswith('wikidot.com'):
+        segments = segments[1:]
+    if not segments:
+        return None
+    return urllib.parse.unquote('/'.join(segments)).lower()
 
 
 if __name__ == "__main__":
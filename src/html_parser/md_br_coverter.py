@@ -8,4 +8,11 @@ class KeepBrConverter(MarkdownConverter):
 
 # 2. 封装便捷转换函数（参考官方示例）
 def md_keep_br(html, **options):
-    return KeepBrConverter(**options).convert(html)
\ No newline at end of file
+    return KeepBrConverter(**options).convert(html)
+
+# 3. 直接转换已解析的标签，省去序列化为字符串再重新解析的开销
+def md_keep_br_soup(tag, **options):
+    converter = KeepBrConverter(**options)
+    text = converter.convert_soup(tag)
+    # convert 的输入是整个文档，会在最后去掉首尾的空行；直接转换单个标签时需要补上这一步
+    return converter.convert__document_(tag, text, set())
@@ -0,0 +1,223 @@
+"""
+规则元数据提取
+大多数 SCP 页面的开头是固定的 "项目编号/项目等级/特殊收容措施" 格式，
+用预编译的正则表达式直接提取项目等级、收容等级和相关站点，作为笔记属性写入，
+只有无法解析的页面才需要交给智能体处理。
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from bs4 import CData, NavigableString, Tag
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 只在正文开头查找等级字段，避免匹配到正文中提及的其他项目
+_HEADER_CHARS = 2000
+
+# "项目等级：Euclid"、"Object Class: Keter"，等级必须与字段名在同一行
+_OBJECT_CLASS_PATTERN = re.compile(
+    r'(?:项目等级|项目级别|Object\s+Class)[^\S\n]*[:：][^\S\n]*([^\n]+)', re.IGNORECASE)
+
+# 新版异常分级系统（ACS）中的 "收容等级：Euclid"、"Containment Class: Safe"
+_CONTAINMENT_CLASS_PATTERN = re.compile(
+    r'(?:收容等级|收容级别|Containment\s+Class)[^\S\n]*[:：][^\S\n]*([^\n]+)', re.IGNORECASE)
+
+# 以其他字段名开头的值（如 "特殊收容措施："），说明等级字段本身是空的
+_FIELD_LABEL_PATTERN = re.compile(r'^[\w\s]{1,20}[:：]')
+
+# 按块级元素拼接文本，字段名（常在 <strong> 中）和值在同一行
+_BLOCK_TAGS = ['p', 'li', 'dt', 'dd', 'td', 'th', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+
+# "Site-19"、"Area 14"、"站点-17"、"区域-12"
+_SITE_PATTERN = re.compile(
+    r'(?<![A-Za-z0-9-])(Site|Area|Sector|站点|区域)\s*[-‐–—]?\s*(\d+[A-Za-z]?)(?![A-Za-z0-9-])',
+    re.IGNORECASE)
+
+_SITE_PREFIXES = {
+    'site': 'Site',
+    'area': 'Area',
+    'sector': 'Sector',
+    '站点': 'Site',
+    '区域': 'Area',
+}
+
+# 等级的常见写法 -> 标准名称
+_CLASS_NAMES = {
+    'safe': 'Safe',
+    '安全': 'Safe',
+    'euclid': 'Euclid',
+    '欧几里得': 'Euclid',
+    'keter': 'Keter',
+    'thaumiel': 'Thaumiel',
+    'apollyon': 'Apollyon',
+    '亚玻伦': 'Apollyon',
+    'archon': 'Archon',
+    '执政官': 'Archon',
+    'neutralized': 'Neutralized',
+    '无效化': 'Neutralized',
+    '已无效化': 'Neutralized',
+    'explained': 'Explained',
+    '已解明': 'Explained',
+    'pending': 'Pending',
+    '待定': 'Pending',
+}
+
+# 等级值中分隔主等级和说明的字符，如 "Euclid（曾为 Keter）"
+_CLASS_SPLIT_PATTERN = re.compile(r'[（(\[【,，;；/]')
+
+# 非标准等级（Esoteric）保留的最大长度
+_MAX_CLASS_LENGTH = 30
+
+
+def _normalize_class(value: str) -> str:
+    """将等级字段的值转换为标准名称，非标准等级保留原文"""
+    if _FIELD_LABEL_PATTERN.match(value.strip()):
+        return ""
+    value = _CLASS_SPLIT_PATTERN.split(value, 1)[0].strip().strip('*_ ')
+    if not value:
+        return ""
+    name = _CLASS_NAMES.get(value.lower())
+    if name:
+        return name
+    first_word = value.split()[0]
+    return _CLASS_NAMES.get(first_word.lower(), value[:_MAX_CLASS_LENGTH])
+
+
+@dataclass
+class PageMetadata:
+    """从页面中提取的元数据"""
+    object_class: str = ""
+    containment_class: str = ""
+    sites: list[str] = field(default_factory=list)
+
+    @property
+    def parsed(self) -> bool:
+        """是否提取到等级信息，未提取到的页面需要交给智能体处理"""
+        return bool(self.object_class or self.containment_class)
+
+    def to_properties(self) -> Dict[str, Any]:
+        """转换为笔记属性，站点写为双向链接"""
+        return {
+            "object_class": self.object_class,
+            "containment_class": self.containment_class,
+            "sites": [f"[[{site}]]" for site in self.sites],
+        }
+
+
+def _block_text(page_content_div: Tag) -> str:
+    """每个块级元素的文本占一行，块内的文本直接拼接，<br> 换行"""
+    blocks = [block for block in page_content_div.find_all(_BLOCK_TAGS)
+              if block.find(_BLOCK_TAGS) is None]
+    if not blocks:
+        return page_content_div.get_text('\n')
+    return '\n'.join(_inline_text(block).strip() for block in blocks)
+
+
+def _inline_text(block: Tag) -> str:
+    """拼接块内的文本，<br> 转换为换行，不修改解析树"""
+    parts = []
+    for node in block.descendants:
+        if type(node) in (NavigableString, CData):
+            parts.append(str(node))
+        elif isinstance(node, Tag) and node.name == 'br':
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def extract_metadata(page_content_div: Optional[Tag]) -> PageMetadata:
+    """
+    从清理后的正文中提取元数据，需在 rewrite_links 之前调用
+
+    Args:
+        page_content_div: SCPHtmlProcessor.page_content_div
+
+    Returns:
+        PageMetadata: 提取结果，未找到的字段为空
+    """
+    metadata = PageMetadata()
+    if page_content_div is None:
+        return metadata
+
+    text = page_content_div.get_text('\n')
+    header = _block_text(page_content_div)[:_HEADER_CHARS]
+
+    match = _OBJECT_CLASS_PATTERN.search(header)
+    if match:
+        metadata.object_class = _normalize_class(match.group(1))
+    match = _CONTAINMENT_CLASS_PATTERN.search(header)
+    if match:
+        metadata.containment_class = _normalize_class(match.group(1))
+
+    seen = set()
+    for prefix, number in _SITE_PATTERN.findall(text):
+        site = f"{_SITE_PREFIXES[prefix.lower()]}-{number.upper()}"
+        if site not in seen:
+            seen.add(site)
+            metadata.sites.append(site)
+    return metadata
+
+
+class MetadataReport:
+    """
+    统计提取覆盖率，并维护需要交给智能体处理的页面队列，线程安全
+
+    队列保存在 JSON 文件中: {条目键: {"reason": 原因}}，页面之后被成功解析时从队列中移除。
+    """
+
+    def __init__(self, queue_file: str):
+        self.queue_file = queue_file
+        self.queue: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self.total = 0
+        self.parsed = 0
+        self.object_class = 0
+        self.containment_class = 0
+        self.sites = 0
+        if os.path.exists(queue_file):
+            try:
+                with open(queue_file, 'r', encoding='utf-8') as f:
+                    self.queue = json.load(f).get('items', {})
+            except Exception as e:
+                logger.warning("加载智能体队列失败，将重新建立: %s", e)
+
+    def record(self, item_key: str, metadata: PageMetadata):
+        """记录一个条目的提取结果"""
+        with self._lock:
+            self.total += 1
+            self.parsed += metadata.parsed
+            self.object_class += bool(metadata.object_class)
+            self.containment_class += bool(metadata.containment_class)
+            self.sites += bool(metadata.sites)
+            if metadata.parsed:
+                self.queue.pop(item_key, None)
+            else:
+                self.queue[item_key] = {"reason": "未找到项目等级或收容等级"}
+
+    def save(self):
+        """保存智能体队列"""
+        os.makedirs(os.path.dirname(self.queue_file), exist_ok=True)
+        tmp_file = f"{self.queue_file}.tmp"
+        with self._lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'items': self.queue}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.queue_file)
+
+    def stats(self) -> dict:
+        """返回覆盖率统计"""
+        def rate(count: int) -> str:
+            return f"{count / self.total * 100:.1f}%" if self.total else "0.0%"
+
+        return {
+            "项目等级": rate(self.object_class),
+            "收容等级": rate(self.containment_class),
+            "站点": rate(self.sites),
+            "等级覆盖率": rate(self.parsed),
+            "待智能体处理": len(self.queue),
+        }
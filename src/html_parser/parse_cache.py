@@ -0,0 +1,151 @@
+"""
+解析结果缓存
+将清理后的 #page-content HTML、标题、图片和标签列表按 (归档 UUID, 条目路径, 清理器版本) 缓存到磁盘。
+只修改 Markdown 转换阶段（标签格式、KeepBrConverter 参数等）后重新导出时，
+不需要再解析整页 HTML 和执行 _remove_unwanted_elements。
+缓存总大小超过上限时按最近使用时间淘汰。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 淘汰时清理到上限的比例，避免每次写入都触发淘汰
+_EVICT_TARGET = 0.9
+
+
+class ParseCache:
+    """按大小限制、LRU 淘汰的磁盘缓存，线程安全"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # 文件名 -> 大小，按最近使用顺序排列（最久未使用的在前）
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._load_index()
+
+    def _load_index(self):
+        """按修改时间（命中时会更新）恢复使用顺序"""
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.json.z'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+
+    @staticmethod
+    def _file_name(uuid: str, path: str, version: int) -> str:
+        key = f"{uuid}\0{path}\0{version}".encode('utf-8')
+        return f"{hashlib.sha1(key).hexdigest()}.json.z"
+
+    def contains(self, uuid: str, path: str, version: int) -> bool:
+        """检查是否有缓存，不读取内容也不计入命中统计"""
+        with self._lock:
+            return self._file_name(uuid, path, version) in self._entries
+
+    def get(self, uuid: str, path: str, version: int) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存
+
+        Args:
+            uuid: 归档 UUID
+            path: 条目路径
+            version: 清理器版本
+
+        Returns:
+            Optional[Dict[str, Any]]: 缓存的解析结果，未命中时返回 None
+        """
+        name = self._file_name(uuid, path, version)
+        file_path = os.path.join(self.cache_dir, name)
+        try:
+            with open(file_path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()))
+            os.utime(file_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning("解析缓存已损坏，将重新解析: %s - %s", path, e)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if name in self._entries:
+                self._entries.move_to_end(name)
+        return entry
+
+    def put(self, uuid: str, path: str, version: int, entry: Dict[str, Any]):
+        """
+        写入缓存，总大小超过上限时淘汰最久未使用的条目
+
+        Args:
+            uuid: 归档 UUID
+            path: 条目路径
+            version: 清理器版本
+            entry: 解析结果，需可 JSON 序列化
+        """
+        name = self._file_name(uuid, path, version)
+        file_path = os.path.join(self.cache_dir, name)
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False).encode('utf-8'), 1)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            logger.warning("写入解析缓存失败: %s - %s", path, e)
+            return
+
+        with self._lock:
+            self._total += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的条目，调用时需持有锁"""
+        target = self.max_bytes * _EVICT_TARGET
+        while self._entries and self._total > target:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.evicted += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+        logger.debug("解析缓存淘汰后大小: %d 字节", self._total)
+
+    def stats(self) -> dict:
+        """返回缓存统计"""
+        return {
+            "命中": self.hits,
+            "未命中": self.misses,
+            "淘汰": self.evicted,
+            "大小": f"{self._total / (1024 * 1024):.2f} MB",
+        }
@@ -0,0 +1,136 @@
+"""
+图片资源去重
+多个归档（如中文分部和英文站）引用的相同图片只保存一份。
+
+图片的库内路径只由归档内容决定，与各归档处理线程的先后顺序无关：
+主归档的图片始终使用原路径；其他归档的图片与主归档同一路径下的图片内容相同时共用该文件，
+否则保存到以归档子目录名为前缀的路径下。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Callable, Optional
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+class AssetStore:
+    """按路径和内容去重的图片资源表，线程安全"""
+
+    def __init__(self, state_file: Optional[str] = None):
+        """
+        Args:
+            state_file: 图片来源记录文件，校验库时用于找回图片在归档中的原始数据
+        """
+        self.state_file = state_file
+        # 库内路径 -> {"archive": 归档子目录名, "source": 归档中的路径, "hash": 原图哈希, "output": 输出路径}
+        self.sources: dict[str, dict] = {}
+        # 保存记录时主归档的 UUID，与本次相同时可以直接使用记录中主归档图片的哈希
+        self._saved_primary_uuid = ""
+        if state_file and os.path.exists(state_file):
+            try:
+                with open(state_file, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                self.sources = saved.get('assets', {})
+                self._saved_primary_uuid = saved.get('primary_uuid', "")
+            except Exception as e:
+                logger.warning("加载图片来源记录失败，将重新建立: %s", e)
+        self.primary_uuid = ""
+        # 读取主归档中图片的函数，只有一个归档时为 None
+        self._read_primary: Optional[Callable[[str], Optional[bytes]]] = None
+        # 路径 -> 主归档中该路径图片的内容哈希（不存在时为 None）
+        self._primary_digests: dict[str, Optional[bytes]] = {}
+        # 本次运行中已经认领（需要写出）的库内路径
+        self._claimed: set[str] = set()
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+
+    def set_primary(self, read: Callable[[str], Optional[bytes]], uuid: str = ""):
+        """
+        设置主归档，其他归档的图片与主归档同一路径下的图片比较
+
+        Args:
+            read: 读取主归档中图片的函数，不存在时返回 None
+            uuid: 主归档 UUID，与上次保存记录时相同则沿用记录中的图片哈希，不再读取
+        """
+        self._read_primary = read
+        self.primary_uuid = uuid
+        if uuid and uuid == self._saved_primary_uuid:
+            self._primary_digests = {
+                path: bytes.fromhex(record['hash']) for path, record in self.sources.items()
+                if record.get('archive') == "" and record.get('source') == path
+            }
+
+    def _primary_digest(self, path: str) -> Optional[bytes]:
+        """返回主归档中同一路径图片的内容哈希"""
+        with self._lock:
+            if path in self._primary_digests:
+                return self._primary_digests[path]
+        data = self._read_primary(path) if self._read_primary is not None else None
+        digest = hashlib.blake2b(data).digest() if data else None
+        with self._lock:
+            self._primary_digests[path] = digest
+        return digest
+
+    def claim(self, path: str, data: bytes, label: str = "") -> tuple[str, bool]:
+        """
+        为一张图片确定库内路径
+
+        Args:
+            path: 图片在归档中的路径
+            data: 图片字节数据
+            label: 归档的子目录名，主归档为空
+
+        Returns:
+            tuple[str, bool]: (库内路径, 是否需要写出)。本次运行中已写出过时返回 False
+        """
+        digest = hashlib.blake2b(data).digest()
+        archive = label
+        target = path
+        if label:
+            if self._primary_digest(path) == digest:
+                # 与主归档中的图片相同，共用主归档的文件
+                archive = ""
+            else:
+                target = f"{label}/{path}"
+
+        with self._lock:
+            if target in self._claimed:
+                self.deduplicated += 1
+                return target, False
+            self._claimed.add(target)
+            if not label:
+                self._primary_digests[path] = digest
+            self.sources[target] = {'archive': archive, 'source': path, 'hash': digest.hex(), 'output': target}
+            self.stored += 1
+            return target, True
+
+    def set_output(self, path: str, output_path: str):
+        """记录图片转码后的实际输出路径"""
+        with self._lock:
+            if path in self.sources:
+                self.sources[path]['output'] = output_path
+
+    def save(self):
+        """保存图片来源记录"""
+        if not self.state_file:
+            return
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with self._lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': 2, 'primary_uuid': self.primary_uuid, 'assets': self.sources},
+                          f, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def stats(self) -> dict:
+        """返回去重统计"""
+        return {
+            "保存": self.stored,
+            "去重": self.deduplicated,
+        }
@@ -0,0 +1,342 @@
+"""
+Dify 知识库批量上传
+将导出的 Markdown 笔记上传到 Dify 知识库（通过文本创建/更新文档）。
+所有请求复用连接池中的长连接，按并发上限并行上传，遇到限流、服务端错误和连接错误时退避重试。
+内容哈希与上次上传相同的文档会被跳过，上传进度记录在处理状态跟踪器中，可以断点接续。
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import quote, urlsplit
+
+from src.utils.log_tool import HOT
+from src.utils.processing_tracker import SCPProcessingTracker
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 可以重试的 HTTP 状态码（限流和服务端错误）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 服务端可能已经处理了请求的状态码，非幂等请求重试前需要先确认结果
+AMBIGUOUS_STATUSES = {500, 502, 504}
+
+# 每上传多少个文档保存一次跟踪器状态
+_SAVE_EVERY = 50
+
+
+class DifyAPIError(Exception):
+    """Dify API 返回错误"""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in RETRY_STATUSES
+
+    @property
+    def ambiguous(self) -> bool:
+        return self.status in AMBIGUOUS_STATUSES
+
+
+class ResponseLostError(OSError):
+    """请求已发出但没有收到完整响应，服务端可能已经处理了请求"""
+
+
+class _ConnectionPool:
+    """HTTP 长连接池，每个连接同一时间只被一个线程使用"""
+
+    def __init__(self, base_url: str, timeout: float):
+        parsed = urlsplit(base_url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ValueError(f"不支持的 API 地址: {base_url}")
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname or ''
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self.opened = 0
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        self.opened += 1
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        """取出一个空闲连接（没有时新建），正常使用后放回；出错的连接直接关闭"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class DifyClient:
+    """Dify 知识库 API 客户端，线程安全"""
+
+    def __init__(self, base_url: str, api_key: str, dataset_id: str, timeout: float = 60):
+        """
+        Args:
+            base_url: API 地址，如 "https://api.dify.ai/v1"
+            api_key: 知识库 API 密钥
+            dataset_id: 知识库 ID
+            timeout: 单个请求的超时时间（秒）
+        """
+        self.dataset_id = dataset_id
+        self._pool = _ConnectionPool(base_url, timeout)
+        self._headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+        }
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        发送一个请求
+
+        Args:
+            method: HTTP 方法
+            path: 相对于 API 地址的路径
+            body: JSON 请求体
+
+        Returns:
+            Dict[str, Any]: JSON 响应
+
+        Raises:
+            DifyAPIError: 返回非 2xx 状态码
+            ResponseLostError: 请求已发出，但读取响应时连接出错
+            OSError, http.client.HTTPException: 发出请求前的连接错误
+        """
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None
+        with self._pool.connection() as conn:
+            conn.request(method, self._pool.base_path + path, body=data, headers=self._headers)
+            try:
+                response = conn.getresponse()
+                # 读完响应体后连接才能复用
+                payload = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                raise ResponseLostError(f"{method} {path}: {e}") from e
+            if response.will_close:
+                conn.close()
+
+        if not 200 <= response.status < 300:
+            retry_after = response.getheader('Retry-After')
+            try:
+                message = json.loads(payload).get('message', '')
+            except (ValueError, AttributeError):
+                message = payload[:200].decode('utf-8', 'replace')
+            raise DifyAPIError(response.status, message,
+                               float(retry_after) if retry_after and retry_after.isdigit() else None)
+        return json.loads(payload) if payload else {}
+
+    def create_document(self, name: str, text: str) -> str:
+        """通过文本创建文档，返回文档 ID"""
+        result = self.request('POST', f'/datasets/{self.dataset_id}/document/create-by-text', {
+            'name': name,
+            'text': text,
+            'indexing_technique': 'high_quality',
+            'process_rule': {'mode': 'automatic'},
+        })
+        return result['document']['id']
+
+    def find_document(self, name: str) -> Optional[str]:
+        """按名称查找文档，返回文档 ID，不存在时返回 None"""
+        result = self.request(
+            'GET', f'/datasets/{self.dataset_id}/documents?keyword={quote(name)}&limit=100')
+        for document in result.get('data', []):
+            if document.get('name') == name:
+                return document.get('id')
+        return None
+
+    def update_document(self, document_id: str, name: str, text: str) -> str:
+        """通过文本更新文档，返回文档 ID"""
+        result = self.request(
+            'POST', f'/datasets/{self.dataset_id}/documents/{document_id}/update-by-text',
+            {'name': name, 'text': text})
+        return result.get('document', {}).get('id', document_id)
+
+    @property
+    def connections_opened(self) -> int:
+        return self._pool.opened
+
+    def close(self):
+        self._pool.close()
+
+
+class DifyUploader:
+    """把库中的 Markdown 笔记并行上传到 Dify 知识库"""
+
+    def __init__(self, client: DifyClient, tracker: SCPProcessingTracker, vault_dir: str,
+                 workers: int = 4, max_retries: int = 5, backoff: float = 1.0):
+        """
+        Args:
+            client: API 客户端
+            tracker: 处理状态跟踪器，记录每个文档上传时的内容哈希和文档 ID
+            vault_dir: 库根目录
+            workers: 并发上传数
+            max_retries: 最大重试次数
+            backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+        """
+        self.client = client
+        self.tracker = tracker
+        self.vault_dir = vault_dir
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+
+    def find_documents(self) -> list[str]:
+        """返回库中所有 Markdown 笔记的相对路径（跳过隐藏目录）"""
+        documents = []
+        for dirpath, dirnames, filenames in os.walk(self.vault_dir):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.endswith('.md'):
+                    rel_path = os.path.relpath(os.path.join(dirpath, filename), self.vault_dir)
+                    documents.append(rel_path.replace(os.sep, '/'))
+        return documents
+
+    def _with_retry(self, call: Callable[[], str], rel_path: str,
+                    recover: Optional[Callable[[], Optional[str]]] = None) -> str:
+        """
+        执行请求，失败时退避重试
+
+        Args:
+            call: 发送请求的函数，返回文档 ID
+            rel_path: 文档路径，用于日志
+            recover: 非幂等请求（创建文档）的结果确认函数。请求可能已被服务端处理时
+                （响应丢失或网关错误），重试前先调用它，返回文档 ID 时不再重试
+        """
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except DifyAPIError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else self.backoff * 2 ** attempt
+                uncertain = e.ambiguous
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                uncertain = isinstance(e, ResponseLostError)
+                logger.debug("连接错误，准备重试: %s - %s", rel_path, e)
+            if uncertain and recover is not None:
+                # 服务端可能已经创建了文档，确认后再决定是否重试，避免创建重复文档
+                document_id = self._with_retry(recover, rel_path)
+                if document_id is not None:
+                    logger.info("请求结果未知，已找到服务端创建的文档: %s", rel_path)
+                    return document_id
+            # 加入随机抖动，避免并发请求同时重试
+            delay *= 1 + random.random() * 0.25
+            with self._lock:
+                self.retries += 1
+            attempt += 1
+            logger.info("上传 %s 失败，%.1f 秒后第 %d 次重试", rel_path, delay, attempt)
+            time.sleep(delay)
+
+    def upload_one(self, rel_path: str) -> bool:
+        """
+        上传一个文档，内容未变化时跳过
+
+        Returns:
+            bool: 是否实际上传
+        """
+        with open(os.path.join(self.vault_dir, rel_path), 'r', encoding='utf-8') as f:
+            text = f.read()
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        record = self.tracker.get_upload(rel_path)
+        if record is not None and record.get('hash') == content_hash:
+            with self._lock:
+                self.skipped += 1
+            logger.debug("[SKIP] 内容未变化: %s", rel_path, extra=HOT)
+            return False
+
+        if record is not None and record.get('document_id'):
+            document_id = self._with_retry(
+                lambda: self.client.update_document(record['document_id'], rel_path, text), rel_path)
+        else:
+            document_id = self._with_retry(
+                lambda: self.client.create_document(rel_path, text), rel_path,
+                recover=lambda: self.client.find_document(rel_path))
+
+        self.tracker.record_upload(rel_path, content_hash, document_id)
+        with self._lock:
+            self.uploaded += 1
+        logger.info("[UPLOAD] 已上传: %s", rel_path, extra=HOT)
+        return True
+
+    def upload_all(self, documents: list[str],
+                   on_progress: Optional[Callable[[str, bool], None]] = None):
+        """
+        并行上传文档
+
+        Args:
+            documents: 文档相对路径列表
+            on_progress: 进度回调 on_progress(相对路径, 是否成功)
+        """
+        completed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.upload_one, rel_path): rel_path for rel_path in documents}
+            try:
+                for future in as_completed(futures):
+                    rel_path = futures[future]
+                    try:
+                        future.result()
+                        success = True
+                    except Exception as e:
+                        success = False
+                        with self._lock:
+                            self.failed += 1
+                        logger.error("上传失败: %s - %s", rel_path, e)
+                    completed += 1
+                    if completed % _SAVE_EVERY == 0:
+                        self.tracker.save_status()
+                    if on_progress is not None:
+                        on_progress(rel_path, success)
+            finally:
+                pool.shutdown(cancel_futures=True)
+                self.tracker.save_status()
+
+    def stats(self) -> dict:
+        """返回上传统计"""
+        return {
+            "上传": self.uploaded,
+            "未变化": self.skipped,
+            "失败": self.failed,
+            "重试": self.retries,
+            "连接数": self.client.connections_opened,
+        }
@@ -1,3 +1,8 @@
+import posixpath
+import urllib.parse
+from typing import Callable, Optional
+
+
 def get_scp_subdirectory(scp_id: str) -> str:
     """
     根据 SCP 编号确定应该保存到哪个子目录
@@ -44,4 +49,41 @@ def scp_num_generator(start_num: int = 1, end_num: int = 10000):
         end_num: 结束编号 (默认: 10000)
     """
     for i in range(start_num, end_num + 1):
-        yield f"scp-{i:03d}"
\ No newline at end of file
+        yield f"scp-{i:03d}"
+
+def get_vault_relative_path(path: str, subdirectory: str) -> str:
+    """
+    获取从子目录中的笔记指向库内文件的相对链接路径
+
+    Args:
+        path: 文件相对于库根目录的路径，如 "scp-wiki.wdfiles.com/local--files/scp-002/a.jpg"
+        subdirectory: 笔记所在子目录，如 "001-1000"
+
+    Returns:
+        str: 相对链接路径，如 "../scp-wiki.wdfiles.com/local--files/scp-002/a.jpg"
+    """
+    relative = posixpath.relpath(path, subdirectory)
+    # 文件名中的 % 是字面字符（如 "%E5%9B%BE.png"），也需要转义为 %25，否则链接会被解码为其他文件名
+    return urllib.parse.quote(relative, safe="/")
+
+
+def build_article_link_map(start_num: int = 1, end_num: int = 10000, prefix: str = "",
+                           exists: Optional[Callable[[str], bool]] = None) -> dict[str, str]:
+    """
+    构建页面名 -> 笔记名的映射，用于把站内条目链接改写为 [[笔记名]]
+
+    Args:
+        start_num: 开始编号 (默认: 1)
+        end_num: 结束编号 (默认: 10000)
+        prefix: 笔记所在的库内子目录，非空时使用完整路径以免与其他归档的同名笔记混淆
+        exists: 检查条目是否存在的函数（如 ReadZIM.has_content），不存在的条目不加入映射，
+            指向它们的链接保持原样并计入 links_unresolved
+
+    Returns:
+        dict[str, str]: 如 {"scp-173": "scp-173"} 或 {"scp-173": "eng/001-1000/scp-173"}
+    """
+    scp_ids = [scp_id for scp_id in scp_num_generator(start_num, end_num)
+               if exists is None or exists(scp_id)]
+    if prefix:
+        return {scp_id: f"{prefix}/{get_scp_subdirectory(scp_id)}/{scp_id}" for scp_id in scp_ids}
+    return {scp_id: scp_id for scp_id in scp_ids}
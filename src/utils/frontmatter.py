@@ -0,0 +1,35 @@
+"""
+Obsidian 笔记属性（YAML frontmatter）
+"""
+
+import json
+from typing import Any, Dict
+
+
+def _yaml_value(value: Any) -> str:
+    """将属性值转换为 YAML，字符串统一使用双引号（JSON 字符串也是合法的 YAML）"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_yaml_value(v) for v in value) + "]"
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def build_frontmatter(properties: Dict[str, Any]) -> str:
+    """
+    生成笔记属性块，空值属性会被忽略
+
+    Args:
+        properties: 属性名到属性值的映射
+
+    Returns:
+        str: 以 "---" 包围的属性块，没有属性时返回空字符串
+    """
+    lines = [f"{key}: {_yaml_value(value)}"
+             for key, value in properties.items()
+             if value not in (None, "", [], ())]
+    if not lines:
+        return ""
+    return "---\n" + "\n".join(lines) + "\n---\n\n"
@@ -0,0 +1,249 @@
+"""
+图片转码阶段
+在进程池中把图片重新编码为指定格式和质量，并限制最大边长。
+转码结果按 (原图哈希, 转码参数) 缓存到磁盘，未变化的图片不会被重复转码。
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖，只有启用图片转码时才需要
+    Image = None
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 会被转码的图片类型；GIF（可能是动图）和 SVG 保持原样
+TRANSCODABLE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'}
+
+# 输出格式 -> 文件扩展名
+FORMAT_EXTENSIONS = {
+    'webp': '.webp',
+    'jpeg': '.jpg',
+    'png': '.png',
+    'avif': '.avif',
+}
+
+
+def _transcode(data: bytes, image_format: str, quality: int, max_dimension: int) -> bytes:
+    """
+    在子进程中执行的转码函数
+
+    Args:
+        data: 原图字节数据
+        image_format: 输出格式
+        quality: 输出质量 (1-100)
+        max_dimension: 最大边长，0 表示不缩放
+
+    Returns:
+        bytes: 转码后的字节数据
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        if max_dimension and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        if image_format == 'jpeg' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        output = io.BytesIO()
+        img.save(output, format=image_format.upper(), quality=quality, optimize=True)
+        return output.getvalue()
+
+
+def _is_readable(data: bytes) -> bool:
+    """检查图片数据能否被识别（只读取文件头和校验结构，不解码像素）"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+
+
+class ImageStage:
+    """
+    图片转码阶段
+
+    submit 会立即返回转码后的文件路径，实际转码在进程池中完成，完成后通过回调写出结果。
+    无法识别的图片不转码，按原路径写出原图。
+    """
+
+    def __init__(self, cache_dir: str, image_format: str = 'webp', quality: int = 80,
+                 max_dimension: int = 1600, workers: Optional[int] = None,
+                 max_pending: int = 64):
+        """
+        Args:
+            cache_dir: 转码结果缓存目录
+            image_format: 输出格式，见 FORMAT_EXTENSIONS
+            quality: 输出质量 (1-100)
+            max_dimension: 最大边长，0 表示不缩放
+            workers: 进程数，默认为 CPU 核数
+            max_pending: 最多同时等待转码的图片数，用于限制内存占用
+        """
+        if Image is None:
+            raise RuntimeError("图片转码需要安装 Pillow: pip install pillow")
+        if image_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"不支持的图片格式: {image_format}")
+
+        self.cache_dir = cache_dir
+        self.image_format = image_format
+        self.quality = quality
+        self.max_dimension = max_dimension
+        self.settings_key = f"{image_format}-q{quality}-m{max_dimension}"
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: set[Future] = set()
+        self._lock = threading.Condition()
+        # 原图路径 -> 输出路径，记录每张图片是否转码
+        self._outputs: dict[str, str] = {}
+        self.transcoded = 0
+        self.cache_hits = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def target_path(self, src: str) -> str:
+        """
+        返回图片转码后的路径
+
+        保留原扩展名（如 "a.png" -> "a.png.webp"），避免同一目录下的 "a.png" 和 "a.jpg" 转码后重名。
+
+        Args:
+            src: 原图路径
+
+        Returns:
+            str: 转码后的路径，不转码的图片返回原路径
+        """
+        ext = os.path.splitext(src)[1].lower()
+        target_ext = FORMAT_EXTENSIONS[self.image_format]
+        if ext not in TRANSCODABLE_EXTENSIONS or ext == target_ext:
+            return src
+        return src + target_ext
+
+    def output_path(self, src: str, data: bytes) -> str:
+        """
+        返回图片实际的输出路径
+
+        Args:
+            src: 原图路径
+            data: 原图字节数据
+
+        Returns:
+            str: 可以转码的图片返回转码后的路径，无法识别的图片返回原路径
+        """
+        target = self.target_path(src)
+        if target == src:
+            return src
+        with self._lock:
+            output = self._outputs.get(src)
+        if output is None:
+            # 同一路径的图片内容相同（由 AssetStore 保证），检查结果可以复用
+            output = target if _is_readable(data) else src
+            with self._lock:
+                self._outputs[src] = output
+        return output
+
+    def _cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}-{self.settings_key}{FORMAT_EXTENSIONS[self.image_format]}")
+
+    def submit(self, src: str, data: bytes, on_done: Callable[[str, bytes], None]) -> str:
+        """
+        提交一张图片
+
+        Args:
+            src: 原图路径
+            data: 原图字节数据
+            on_done: 结果回调 on_done(输出路径, 输出数据)，可能在其他线程中调用
+
+        Returns:
+            str: 输出路径
+        """
+        target = self.output_path(src, data)
+        if target == src:
+            if self.target_path(src) != src:
+                logger.warning("无法识别的图片，不转码: %s", src)
+                with self._lock:
+                    self.failed += 1
+            on_done(src, data)
+            return src
+
+        digest = hashlib.sha256(data).hexdigest()
+        cache_path = self._cache_path(digest)
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = f.read()
+            with self._lock:
+                self.cache_hits += 1
+                self.bytes_in += len(data)
+                self.bytes_out += len(cached)
+            on_done(target, cached)
+            return target
+        except FileNotFoundError:
+            pass
+
+        self._slots.acquire()
+        future = self._executor.submit(
+            _transcode, data, self.image_format, self.quality, self.max_dimension)
+        with self._lock:
+            self._pending.add(future)
+
+        def _finish(done: Future):
+            try:
+                result = done.result()
+                tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(result)
+                os.replace(tmp_path, cache_path)
+                with self._lock:
+                    self.transcoded += 1
+                    self.bytes_in += len(data)
+                    self.bytes_out += len(result)
+            except Exception as e:
+                # 转码失败时按原路径写出原图，不把原图数据写到转码后的文件名下
+                logger.error("图片转码失败，按原路径写出原图（笔记中的链接不会更新）: %s - %s", src, e)
+                result = None
+                with self._lock:
+                    self.failed += 1
+            try:
+                if result is None:
+                    on_done(src, data)
+                else:
+                    on_done(target, result)
+            except Exception as e:
+                logger.error("写出转码图片失败: %s - %s", target, e)
+            finally:
+                self._slots.release()
+                with self._lock:
+                    self._pending.discard(done)
+                    self._lock.notify_all()
+
+        future.add_done_callback(_finish)
+        return target
+
+    def drain(self):
+        """等待所有已提交的图片处理完成（包括结果回调）"""
+        with self._lock:
+            self._lock.wait_for(lambda: not self._pending)
+
+    def close(self):
+        """等待剩余任务并关闭进程池"""
+        self.drain()
+        self._executor.shutdown()
+
+    def stats(self) -> dict:
+        """返回转码统计"""
+        saved = self.bytes_in - self.bytes_out
+        return {
+            "转码": self.transcoded,
+            "缓存命中": self.cache_hits,
+            "失败": self.failed,
+            "节省空间": f"{saved / (1024 * 1024):.2f} MB",
+        }
@@ -0,0 +1,196 @@
+"""
+索引笔记（MOC）
+为每个编号范围目录维护一篇索引笔记，并维护一篇总索引。
+条目信息保存在一个小的旁路索引文件中，每次只重新生成有条目变化的范围，
+不需要重新扫描和读取库中的 Markdown 文件。
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from src.utils.filepath_tool import get_scp_subdirectory
+from src.utils.output_sink import OutputSink
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 项目等级标签 -> 显示名称
+OBJECT_CLASS_TAGS = {
+    'safe': 'Safe',
+    'euclid': 'Euclid',
+    'keter': 'Keter',
+    'thaumiel': 'Thaumiel',
+    'apollyon': 'Apollyon',
+    'archon': 'Archon',
+    'neutralized': 'Neutralized',
+    'explained': 'Explained',
+    'esoteric-class': 'Esoteric',
+    '无效化': 'Neutralized',
+    '已解明': 'Explained',
+}
+
+# 总索引笔记路径
+GLOBAL_NOTE = "SCP-MOC.md"
+
+
+def object_class_from_tags(tags: list[str]) -> str:
+    """
+    根据页面标签推断项目等级
+
+    Args:
+        tags: 标签列表，可以带或不带 "#" 前缀
+
+    Returns:
+        str: 项目等级，无法推断时返回空字符串
+    """
+    for tag in tags:
+        object_class = OBJECT_CLASS_TAGS.get(tag.lstrip('#').lower())
+        if object_class:
+            return object_class
+    return ""
+
+
+def range_note_path(subdirectory: str, prefix: str = "") -> str:
+    """返回编号范围索引笔记的相对路径，如 "001-1000/MOC-001-1000.md" """
+    note = f"{subdirectory}/MOC-{subdirectory}.md"
+    return f"{prefix}/{note}" if prefix else note
+
+
+def _scp_sort_key(scp_id: str):
+    try:
+        return (0, int(scp_id[4:]), scp_id)
+    except ValueError:
+        return (1, 0, scp_id)
+
+
+def _cell(text: str) -> str:
+    """转义表格单元格中的特殊字符"""
+    return text.replace('|', '\\|').replace('\n', ' ')
+
+
+class IndexNotes:
+    """按编号范围增量维护的索引笔记"""
+
+    def __init__(self, state_dir: str, sink: OutputSink, prefix: str = ""):
+        """
+        Args:
+            state_dir: 旁路索引文件所在目录
+            sink: 索引笔记的输出目标
+            prefix: 笔记所在的库内子目录，主归档为空
+        """
+        self.index_file = os.path.join(state_dir, f'index-{prefix}.json' if prefix else 'index.json')
+        self.sink = sink
+        self.prefix = prefix
+        self.global_note = f"{prefix}/{GLOBAL_NOTE}" if prefix else GLOBAL_NOTE
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.dirty_ranges: set[str] = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """加载旁路索引"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.items = json.load(f).get('items', {})
+        except Exception as e:
+            logger.warning("加载索引文件失败，将重新建立: %s", e)
+            self.items = {}
+
+    def _save(self):
+        """保存旁路索引"""
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'items': self.items}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def update(self, scp_id: str, title: str, object_class: str, tags: list[str]):
+        """
+        记录一个（重新）导出的条目，内容有变化时标记其范围需要重新生成
+
+        Args:
+            scp_id: SCP 编号，如 "scp-173"
+            title: 标题
+            object_class: 项目等级
+            tags: 标签列表（不带 "#"）
+        """
+        entry = {'title': title, 'object_class': object_class, 'tags': tags}
+        with self._lock:
+            if self.items.get(scp_id) == entry:
+                return
+            self.items[scp_id] = entry
+            self.dirty_ranges.add(get_scp_subdirectory(scp_id))
+
+    def remove(self, scp_id: str):
+        """移除一个已不存在的条目"""
+        with self._lock:
+            if self.items.pop(scp_id, None) is not None:
+                self.dirty_ranges.add(get_scp_subdirectory(scp_id))
+
+    def _render_range(self, subdirectory: str, scp_ids: list[str]) -> str:
+        lines = [
+            f"# SCP {subdirectory}",
+            "",
+            "| 条目 | 标题 | 项目等级 | 标签 |",
+            "| --- | --- | --- | --- |",
+        ]
+        for scp_id in scp_ids:
+            entry = self.items[scp_id]
+            link = f"{self.prefix}/{subdirectory}/{scp_id}\\|{scp_id}" if self.prefix else scp_id
+            lines.append(
+                f"| [[{link}]] | {_cell(entry['title'])} | {_cell(entry['object_class'])} "
+                f"| {_cell(', '.join(entry['tags']))} |")
+        return "\n".join(lines) + "\n"
+
+    def _render_global(self, ranges: Dict[str, list[str]]) -> str:
+        lines = [
+            "# SCP 索引",
+            "",
+            "| 范围 | 条目数 |",
+            "| --- | --- |",
+        ]
+        for subdirectory in sorted(ranges, key=lambda r: _scp_sort_key(f"scp-{r.split('-')[0]}")):
+            note = range_note_path(subdirectory, self.prefix)[:-3]
+            lines.append(f"| [[{note}\\|{subdirectory}]] | {len(ranges[subdirectory])} |")
+        return "\n".join(lines) + "\n"
+
+    def flush(self, force_all: bool = False) -> Optional[int]:
+        """
+        重新生成有变化的范围索引笔记和总索引，并保存旁路索引
+
+        Args:
+            force_all: 是否重新生成所有范围的索引笔记
+
+        Returns:
+            Optional[int]: 重新生成的范围数量，没有变化时返回 None
+        """
+        with self._lock:
+            if not self.dirty_ranges and not force_all:
+                return None
+
+            ranges: Dict[str, list[str]] = {}
+            for scp_id in self.items:
+                ranges.setdefault(get_scp_subdirectory(scp_id), []).append(scp_id)
+
+            targets = set(ranges) if force_all else self.dirty_ranges
+            for subdirectory in targets:
+                scp_ids = sorted(ranges.get(subdirectory, []), key=_scp_sort_key)
+                note_path = range_note_path(subdirectory, self.prefix)
+                if scp_ids:
+                    self.sink.write_text(note_path, self._render_range(subdirectory, scp_ids),
+                                         shard=note_path.rsplit('/', 1)[0].replace('/', '-'))
+                else:
+                    self.sink.remove(note_path)
+
+            self.sink.write_text(self.global_note, self._render_global(ranges))
+            self._save()
+
+            count = len(targets)
+            self.dirty_ranges = set()
+        logger.info("索引笔记已更新: %d 个范围", count)
+        return count
@@ -0,0 +1,223 @@
+"""
+日志工具
+提供同步/队列两种日志模式、JSON Lines 结构化输出、热路径日志采样，
+以及在可能被中止的阶段中暂存日志记录的 deferred_logging()
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+# 热路径日志标记，用法: logger.info("...", extra=HOT)
+HOT = {"hot": True}
+
+# 队列模式下的后台监听器
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# 处于 deferred_logging() 中的线程暂存的 (处理器, 日志记录)
+_deferred = threading.local()
+
+_LEVELS = (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """将日志记录格式化为一行 JSON（JSON Lines）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        # 通过 extra={"fields": {...}} 传入的结构化字段
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class HotPathSampler(logging.Filter):
+    """
+    热路径日志采样器
+
+    低于 sample_level 的记录以及标记为 hot 的记录，按 (logger, 消息模板) 分组，
+    每 every_n 条只保留 1 条；其他记录全部放行。
+    """
+
+    def __init__(self, every_n: int = 1, sample_level: int = logging.INFO):
+        super().__init__()
+        self.every_n = max(1, every_n)
+        self.sample_level = sample_level
+        self._counters: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every_n == 1:
+            return True
+        if record.levelno >= self.sample_level and not getattr(record, "hot", False):
+            return True
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, str(record.msg))
+        with self._lock:
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+        return count % self.every_n == 0
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    不在调用线程中格式化消息的 QueueHandler
+
+    标准 QueueHandler.prepare 会在调用线程里执行 format，这里只复制记录，
+    把格式化和写文件都留给后台监听线程。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return logging.makeLogRecord(record.__dict__)
+
+
+class _DeferringHandler(logging.Handler):
+    """
+    根日志记录器上唯一的处理器，把记录分发给实际的处理器
+
+    当前线程处于 deferred_logging() 中时只暂存记录，不获取任何锁，离开后再分发。
+    """
+
+    def __init__(self, *handlers: logging.Handler):
+        super().__init__()
+        self.targets = handlers
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        pending = getattr(_deferred, "records", None)
+        if pending is not None:
+            pending.append((self, record))
+        else:
+            self.dispatch(record)
+        return True
+
+    def emit(self, record: logging.LogRecord):
+        self.dispatch(record)
+
+    def dispatch(self, record: logging.LogRecord):
+        for handler in self.targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def _warm_level_cache():
+    """
+    填充所有日志记录器的级别缓存
+
+    Logger.isEnabledFor 在缓存未命中时会获取 logging 模块锁，填充后日志调用只查缓存。
+    """
+    loggers = [logging.getLogger()] + [
+        item for item in list(logging.root.manager.loggerDict.values())
+        if isinstance(item, logging.Logger)
+    ]
+    for item in loggers:
+        for level in _LEVELS:
+            item.isEnabledFor(level)
+
+
+@contextmanager
+def deferred_logging():
+    """
+    暂存当前线程在此期间产生的日志记录，离开时再交给处理器
+
+    用于看门狗可能注入异常的阶段：处理器持有锁时被中止，锁不会被释放，
+    之后所有线程写日志都会卡住。暂存期间的日志调用不获取任何锁。可以嵌套。
+    """
+    if getattr(_deferred, "records", None) is not None:
+        yield
+        return
+    _warm_level_cache()
+    _deferred.records = []
+    try:
+        yield
+    finally:
+        records = _deferred.records
+        _deferred.records = None
+        for handler, record in records:
+            handler.dispatch(record)
+
+
+def setup_logging(log_dir: str,
+                  level: str = "INFO",
+                  mode: str = "queue",
+                  fmt: str = "text",
+                  sample_every: int = 1) -> str:
+    """
+    配置根日志记录器
+
+    Args:
+        log_dir: 日志目录
+        level: 日志文件记录的最低级别
+        mode: "sync" 直接写文件；"queue" 由后台线程格式化并写文件
+        fmt: "text" 文本格式；"json" JSON Lines 格式
+        sample_every: 热路径日志采样间隔，1 表示不采样
+
+    Returns:
+        str: 日志文件路径
+    """
+    global _listener
+
+    os.makedirs(log_dir, exist_ok=True)
+    suffix = "jsonl" if fmt == "json" else "log"
+    log_file = os.path.join(
+        log_dir, f'scp_processing_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{suffix}')
+
+    # 创建日志格式器
+    text_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_formatter = JsonLinesFormatter() if fmt == "json" else text_formatter
+
+    # 创建文件处理器
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setLevel(level)
+    file_handler.setFormatter(file_formatter)
+
+    # 创建控制台处理器（只显示警告和错误）
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(text_formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    # 根日志级别与文件级别一致，被过滤的调用不会创建日志记录
+    root.setLevel(level)
+
+    sampler = HotPathSampler(sample_every)
+    if mode == "queue":
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(sampler)
+        root.addHandler(_DeferringHandler(queue_handler))
+        _listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        file_handler.addFilter(sampler)
+        root.addHandler(_DeferringHandler(file_handler, console_handler))
+
+    return log_file
+
+
+def shutdown_logging():
+    """停止后台日志线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    logging.shutdown()
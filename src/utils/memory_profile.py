@@ -0,0 +1,120 @@
+"""
+条目内存采样
+记录每个条目处理期间的内存峰值：tracemalloc 模式记录 Python 对象分配的峰值，
+rss 模式由后台线程定期采样常驻内存，记录处理期间相对开始时的最大增长。
+在处理摘要中列出占用内存最多的条目。
+两种统计都是全进程的，多线程处理时各条目的峰值会互相叠加，只能作为近似值；
+需要精确数据时使用 --workers 1。
+"""
+
+import heapq
+import logging
+import threading
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from src.utils.watchdog import current_rss
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+class MemoryProfiler:
+    """逐条目的内存采样，线程安全"""
+
+    def __init__(self, mode: str = 'rss', top: int = 10, interval: float = 0.02):
+        """
+        Args:
+            mode: "rss" 只采样常驻内存（开销很小），"tracemalloc" 记录 Python 对象分配的峰值
+            top: 摘要中列出的条目数
+            interval: rss 模式的采样间隔（秒）
+        """
+        if mode not in ('rss', 'tracemalloc'):
+            raise ValueError(f"不支持的采样方式: {mode}")
+        self.mode = mode
+        self.top = top
+        # (内存, 条目键) 小顶堆，只保留最大的 top 个
+        self._worst: list[tuple[int, str]] = []
+        self._active = 0
+        # rss 模式下正在处理的条目: 编号 -> [开始时的 RSS, 处理期间的 RSS 峰值]
+        self._samples: dict[int, list[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.max_rss = current_rss() or 0
+        self._stop_event = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        if mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if mode == 'rss':
+            self._sampler = threading.Thread(
+                target=self._sample_loop, args=(interval,), name="memory-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self, interval: float):
+        """定期采样 RSS，更新所有正在处理的条目的峰值"""
+        while not self._stop_event.wait(interval):
+            rss = current_rss()
+            if rss is None:
+                continue
+            with self._lock:
+                self.max_rss = max(self.max_rss, rss)
+                for sample in self._samples.values():
+                    sample[1] = max(sample[1], rss)
+
+    def run(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        执行 func 并记录内存占用
+
+        Args:
+            key: 条目键
+            func: 处理函数
+        """
+        with self._lock:
+            self._active += 1
+            if self.mode == 'tracemalloc':
+                # 没有其他条目在处理时才重置峰值，否则会破坏其他条目的统计
+                if self._active == 1:
+                    tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            else:
+                before = current_rss() or 0
+                sample_id = self._next_id
+                self._next_id += 1
+                self._samples[sample_id] = [before, before]
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                rss = current_rss() or 0
+                self.max_rss = max(self.max_rss, rss)
+                if self.mode == 'tracemalloc':
+                    used = tracemalloc.get_traced_memory()[1] - before
+                else:
+                    # 处理结束时释放的内存已还给分配器，使用处理期间采样到的峰值
+                    used = max(self._samples.pop(sample_id)[1], rss) - before
+                if len(self._worst) < self.top:
+                    heapq.heappush(self._worst, (used, key))
+                elif used > self._worst[0][0]:
+                    heapq.heapreplace(self._worst, (used, key))
+            logger.debug("条目内存: %s %.2f MB", key, used / _MB)
+
+    def close(self):
+        """停止采样线程和 tracemalloc"""
+        if self._sampler is not None:
+            self._stop_event.set()
+            self._sampler.join()
+        if self.mode == 'tracemalloc' and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stats(self) -> dict:
+        """返回进程内存峰值和占用内存最多的条目"""
+        label = "分配峰值" if self.mode == 'tracemalloc' else "RSS 峰值增长"
+        with self._lock:
+            worst = sorted(self._worst, reverse=True)
+            result = {"进程 RSS 峰值": f"{self.max_rss / _MB:.1f} MB"}
+        for used, key in worst:
+            result[f"{key} {label}"] = f"{used / _MB:.2f} MB"
+        return result
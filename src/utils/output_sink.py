@@ -0,0 +1,354 @@
+"""
+输出目标
+make_obsidian_md 通过输出目标写入 Markdown 和图片，支持普通目录、
+单个 tar/zip 归档以及按编号范围分片并行写入的归档
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from typing import Optional
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 已经压缩过的文件类型，写入 zip 时不再压缩
+_STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.zip', '.gz'}
+
+
+class Manifest:
+    """
+    输出清单，记录每个输出文件的大小和内容哈希，用于校验导出结果
+
+    格式: {相对路径: {"size": 字节数, "hash": BLAKE2b 十六进制}}
+    """
+
+    def __init__(self, manifest_file: str, fresh: bool = False):
+        """
+        Args:
+            manifest_file: 清单文件路径
+            fresh: 是否忽略已有清单（归档输出每次都重新写入全部内容）
+        """
+        self.manifest_file = manifest_file
+        self.files: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if not fresh and os.path.exists(manifest_file):
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    self.files = json.load(f).get('files', {})
+            except Exception as e:
+                logger.warning("加载输出清单失败，将重新建立: %s", e)
+
+    def record(self, rel_path: str, data: bytes, digest: Optional[bytes] = None):
+        """记录一个输出文件"""
+        if digest is None:
+            digest = hashlib.blake2b(data).digest()
+        with self._lock:
+            self.files[rel_path] = {'size': len(data), 'hash': digest.hex()}
+
+    def discard(self, rel_path: str):
+        """移除一个已删除的文件"""
+        with self._lock:
+            self.files.pop(rel_path, None)
+
+    def save(self):
+        """保存清单"""
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        tmp_file = f"{self.manifest_file}.tmp"
+        with self._lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'files': self.files}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.manifest_file)
+
+
+class OutputSink(ABC):
+    """输出目标基类，路径均为相对于库根目录、以 / 分隔的路径"""
+
+    # 输出清单，为 None 时不记录
+    manifest: Optional[Manifest] = None
+
+    @abstractmethod
+    def write_bytes(self, rel_path: str, data: bytes, shard: Optional[str] = None) -> None:
+        """
+        写入一个文件
+
+        Args:
+            rel_path: 相对路径，如 "001-1000/scp-173.md"
+            data: 文件内容
+            shard: 分片名（通常为编号范围目录），仅分片归档使用
+        """
+
+    def write_text(self, rel_path: str, text: str, shard: Optional[str] = None) -> None:
+        """以 UTF-8 编码写入文本文件"""
+        self.write_bytes(rel_path, text.encode('utf-8'), shard)
+
+    def remove(self, rel_path: str) -> None:
+        """删除过期文件，归档输出无需删除"""
+
+    def stats(self) -> dict:
+        """返回写入统计"""
+        return {}
+
+    def close(self) -> None:
+        """结束写入并释放资源"""
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _file_digest(path: str) -> bytes:
+    """计算文件内容的哈希"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class DirectorySink(OutputSink):
+    """
+    写入普通目录（默认模式）
+
+    内容与磁盘上已有文件相同时不做任何写入（先比较大小，再比较哈希），
+    保持 mtime 不变；内容变化时先写临时文件再原子替换。
+    """
+
+    def __init__(self, root: str, manifest: Optional[Manifest] = None):
+        self.root = root
+        self.manifest = manifest
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+        self._lock = threading.Lock()
+
+    def _is_unchanged(self, save_path: str, data: bytes, digest: bytes) -> bool:
+        try:
+            if os.path.getsize(save_path) != len(data):
+                return False
+            return _file_digest(save_path) == digest
+        except OSError:
+            return False
+
+    def write_bytes(self, rel_path: str, data: bytes, shard: Optional[str] = None) -> None:
+        save_path = os.path.join(self.root, rel_path)
+        digest = hashlib.blake2b(data).digest()
+        if self.manifest is not None:
+            self.manifest.record(rel_path, data, digest)
+        if self._is_unchanged(save_path, data, digest):
+            with self._lock:
+                self.unchanged += 1
+            return
+
+        # 自动创建所需的目录结构
+        save_dir = os.path.dirname(save_path)
+        os.makedirs(save_dir, exist_ok=True)
+
+        # 写入同目录下的临时文件后原子替换，避免留下写了一半的文件
+        fd, tmp_path = tempfile.mkstemp(
+            dir=save_dir, prefix=f".{os.path.basename(save_path)}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, save_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            self.written += 1
+
+    def remove(self, rel_path: str) -> None:
+        save_path = os.path.join(self.root, rel_path)
+        try:
+            os.remove(save_path)
+        except FileNotFoundError:
+            return
+        finally:
+            if self.manifest is not None:
+                self.manifest.discard(rel_path)
+        logger.info("删除过期文件: %s", rel_path)
+        with self._lock:
+            self.removed += 1
+
+    def stats(self) -> dict:
+        return {
+            "写入": self.written,
+            "未变化": self.unchanged,
+            "删除": self.removed,
+        }
+
+
+class ArchiveSink(OutputSink):
+    """顺序流式写入单个 tar 或 zip 归档，线程安全"""
+
+    def __init__(self, archive_path: str, archive_format: str = 'tar',
+                 manifest: Optional[Manifest] = None):
+        if archive_format not in ('tar', 'zip'):
+            raise ValueError(f"不支持的归档格式: {archive_format}")
+        self.archive_path = archive_path
+        self.manifest = manifest
+        self.archive_format = archive_format
+        self._names: set[str] = set()
+        self._lock = threading.Lock()
+
+        archive_dir = os.path.dirname(archive_path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        if archive_format == 'tar':
+            # 'w|' 为流模式，只做顺序写入
+            self._tar: Optional[tarfile.TarFile] = tarfile.open(archive_path, 'w|')
+            self._zip: Optional[zipfile.ZipFile] = None
+        else:
+            self._tar = None
+            self._zip = zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED)
+        logger.info("打开归档输出: %s", archive_path)
+
+    def write_bytes(self, rel_path: str, data: bytes, shard: Optional[str] = None) -> None:
+        name = rel_path.replace(os.sep, '/')
+        with self._lock:
+            # 同一张图片可能被多个条目引用，归档内只保留一份
+            if name in self._names:
+                return
+            self._names.add(name)
+            if self.manifest is not None:
+                self.manifest.record(name, data)
+
+            if self._tar is not None:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                info.mode = 0o644
+                self._tar.addfile(info, io.BytesIO(data))
+            elif self._zip is not None:
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                ext = os.path.splitext(name)[1].lower()
+                info.compress_type = zipfile.ZIP_STORED if ext in _STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                self._zip.writestr(info, data)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._tar is not None:
+                self._tar.close()
+                self._tar = None
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+        super().close()
+        logger.info("归档已写入: %s (%d 个文件)", self.archive_path, len(self._names))
+
+
+class _ShardWriter(threading.Thread):
+    """单个分片的后台写入线程"""
+
+    def __init__(self, sink: ArchiveSink, max_pending: int):
+        super().__init__(name=f"shard-writer-{os.path.basename(sink.archive_path)}", daemon=True)
+        self.sink = sink
+        self.pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        while True:
+            task = self.pending.get()
+            if task is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.sink.write_bytes(*task)
+            except BaseException as e:
+                self.error = e
+                logger.error("写入分片失败: %s - %s", self.sink.archive_path, e)
+        self.sink.close()
+
+
+class ShardedArchiveSink(OutputSink):
+    """
+    按分片（编号范围）写入多个归档，如 scp-vault-001-1000.tar
+
+    每个分片有自己的写入线程，不同分片之间并行写入。
+    """
+
+    def __init__(self, archive_path: str, archive_format: str = 'tar', max_pending: int = 256,
+                 manifest: Optional[Manifest] = None):
+        base, _ = os.path.splitext(archive_path)
+        self.manifest = manifest
+        self.base_path = base
+        self.archive_format = archive_format
+        self.max_pending = max_pending
+        self._writers: dict[str, _ShardWriter] = {}
+        self._lock = threading.Lock()
+
+    def _get_writer(self, shard: str) -> _ShardWriter:
+        with self._lock:
+            writer = self._writers.get(shard)
+            if writer is None:
+                sink = ArchiveSink(f"{self.base_path}-{shard}.{self.archive_format}", self.archive_format)
+                writer = _ShardWriter(sink, self.max_pending)
+                writer.start()
+                self._writers[shard] = writer
+            return writer
+
+    def write_bytes(self, rel_path: str, data: bytes, shard: Optional[str] = None) -> None:
+        writer = self._get_writer(shard or 'other')
+        if writer.error is not None:
+            raise writer.error
+        if self.manifest is not None:
+            self.manifest.record(rel_path.replace(os.sep, '/'), data)
+        writer.pending.put((rel_path, data))
+
+    def close(self) -> None:
+        with self._lock:
+            writers = list(self._writers.values())
+        for writer in writers:
+            writer.pending.put(None)
+        for writer in writers:
+            writer.join()
+        super().close()
+        for writer in writers:
+            if writer.error is not None:
+                raise writer.error
+
+
+def create_output_sink(output_format: str, output_dir: str,
+                       archive_path: Optional[str] = None,
+                       shard_by_range: bool = False,
+                       manifest_file: Optional[str] = None) -> OutputSink:
+    """
+    根据命令行参数创建输出目标
+
+    Args:
+        output_format: "dir"、"tar" 或 "zip"
+        output_dir: Markdown 输出目录
+        archive_path: 归档文件路径，默认为 "<输出目录>.<格式>"
+        shard_by_range: 是否按编号范围分片写入多个归档
+        manifest_file: 输出清单文件路径，为 None 时不记录清单
+
+    Returns:
+        OutputSink: 输出目标
+    """
+    manifest = Manifest(manifest_file, fresh=output_format != 'dir') if manifest_file else None
+    if output_format == 'dir':
+        return DirectorySink(output_dir, manifest)
+
+    if not archive_path:
+        archive_path = f"{output_dir}.{output_format}"
+    if shard_by_range:
+        return ShardedArchiveSink(archive_path, output_format, manifest=manifest)
+    return ArchiveSink(archive_path, output_format, manifest)
@@ -1,12 +1,28 @@
 
 from datetime import datetime
+import functools
 import json
 import os
-from typing import Any, Dict, Optional
-from venv import logger
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional
 
 from tqdm import tqdm
 
+from src.utils.log_tool import HOT
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+def _synchronized(method):
+    """在跟踪器的锁内执行方法，多个导出线程可以共享同一个跟踪器"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class SCPProcessingTracker:
     """SCP 处理状态跟踪器"""
@@ -15,7 +31,10 @@ class SCPProcessingTracker:
         self.log_dir = log_dir
         self.status_file = os.path.join(log_dir, 'processing_status.json')
         self.failed_file = os.path.join(log_dir, 'failed_items.json')
+        self._lock = threading.RLock()
         self.status_data = self.load_status()
+        # 附加到处理摘要中的统计段落: (标题, 返回统计字典的函数)
+        self.summary_sections: list[tuple[str, Callable[[], Dict[str, Any]]]] = []
         
     def load_status(self) -> dict:
         """加载处理状态"""
@@ -42,14 +61,18 @@ class SCPProcessingTracker:
             }
         }
     
+    @_synchronized
     def save_status(self):
-        """保存处理状态"""
+        """保存处理状态（先写临时文件再替换，中断时不会留下写了一半的状态文件）"""
+        tmp_file = f"{self.status_file}.tmp"
         try:
-            with open(self.status_file, 'w', encoding='utf-8') as f:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(self.status_data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.status_file)
         except Exception as e:
             logger.error(f"保存状态文件失败: {e}")
     
+    @_synchronized
     def start_session(self):
         """开始新的处理会话"""
         self.status_data['current_session'] = {
@@ -61,6 +84,7 @@ class SCPProcessingTracker:
         self.status_data['last_run'] = datetime.now().isoformat()
         logger.info("开始新的SCP处理会话")
     
+    @_synchronized
     def record_success(self, scp_id: str, details: Optional[Dict[str, Any]] = None):
         """记录成功处理的项目"""
         if scp_id not in self.status_data['completed_items']:
@@ -76,17 +100,30 @@ class SCPProcessingTracker:
             self.status_data['failed_items'].remove(scp_id)
             self.status_data['failed'] -= 1
         
-        logger.info(f"[SUCCESS] 成功处理: {scp_id}")
+        logger.info("[SUCCESS] 成功处理: %s", scp_id,
+                    extra={**HOT, "fields": {"scp_id": scp_id, "status": "success"}})
         if details:
-            logger.info(f"   详情: {details}")
+            logger.info("   详情: %s", details,
+                        extra={**HOT, "fields": {"scp_id": scp_id, "details": details}})
         
         self.save_status()
     
-    def record_failure(self, scp_id: str, error: str, details: Optional[Dict[str, Any]] = None):
-        """记录失败的项目"""
+    @_synchronized
+    def record_failure(self, scp_id: str, error: str, details: Optional[Dict[str, Any]] = None,
+                       failure_class: str = "error"):
+        """
+        记录失败的项目
+
+        Args:
+            scp_id: 条目键
+            error: 错误信息
+            details: 详细信息
+            failure_class: 失败类型，如 "error"、"timeout"（处理超时）、"memory"（内存超限）
+        """
         failure_record = {
             'scp_id': scp_id,
             'error': error,
+            'failure_class': failure_class,
             'timestamp': datetime.now().isoformat(),
             'details': details
         }
@@ -112,9 +149,11 @@ class SCPProcessingTracker:
         else:
             failed_items.append(failure_record)
         
+        tmp_file = f"{self.failed_file}.tmp"
         try:
-            with open(self.failed_file, 'w', encoding='utf-8') as f:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(failed_items, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.failed_file)
         except Exception as e:
             logger.error(f"保存失败记录时出错: {e}")
         
@@ -127,12 +166,34 @@ class SCPProcessingTracker:
         self.status_data['current_session']['failed'] += 1
         self.status_data['current_session']['processed'] += 1
         
-        logger.error(f"[FAILED] 处理失败: {scp_id} - {error}")
+        logger.error("[FAILED] 处理失败: %s - %s", scp_id, error,
+                     extra={"fields": {"scp_id": scp_id, "status": "failed", "error": error,
+                                       "failure_class": failure_class}})
         if details:
-            logger.error(f"   详情: {details}")
+            logger.error("   详情: %s", details,
+                         extra={"fields": {"scp_id": scp_id, "details": details}})
         
         self.save_status()
     
+    @_synchronized
+    def get_upload(self, path: str) -> Optional[Dict[str, Any]]:
+        """返回文档上次上传到 Dify 的记录，未上传过时返回 None"""
+        return self.status_data.get('uploads', {}).get(path)
+
+    @_synchronized
+    def record_upload(self, path: str, content_hash: str, document_id: str):
+        """
+        记录上传到 Dify 的文档
+
+        上传数量较多，这里不立即保存状态，由调用方定期调用 save_status
+        """
+        self.status_data.setdefault('uploads', {})[path] = {
+            'hash': content_hash,
+            'document_id': document_id,
+            'timestamp': datetime.now().isoformat(),
+        }
+
+    @_synchronized
     def clear_completed_items(self):
         """清除已完成项目列表（用于重新开始处理）"""
         self.status_data['completed_items'] = []
@@ -160,6 +221,16 @@ class SCPProcessingTracker:
             'failed_items_count': len(self.status_data['failed_items'])
         }
     
+    def add_summary_section(self, title: str, provider: Callable[[], Dict[str, Any]]):
+        """
+        注册一个附加到处理摘要的统计段落
+
+        Args:
+            title: 段落标题
+            provider: 返回 {名称: 值} 的函数，打印摘要时调用
+        """
+        self.summary_sections.append((title, provider))
+
     def print_summary(self):
         """打印处理摘要"""
         stats = self.get_statistics()
@@ -173,8 +244,13 @@ class SCPProcessingTracker:
             f"本次会话处理: {stats['current_session']['processed']}",
             f"本次会话成功: {stats['current_session']['successful']}",
             f"本次会话失败: {stats['current_session']['failed']}",
-            "=" * 50
         ]
+        for title, provider in self.summary_sections:
+            section = provider()
+            if section:
+                summary_lines.append(f"{title}:")
+                summary_lines.extend(f"  {key}: {value}" for key, value in section.items())
+        summary_lines.append("=" * 50)
         
         # 记录到日志文件
         for line in summary_lines:
@@ -188,30 +264,66 @@ class SCPProcessingTracker:
             for line in summary_lines:
                 print(f"[INFO] {line}")
     
+    @_synchronized
     def get_resume_point(self) -> int:
         """
         获取断点接续的起始点
+
+        通常是已完成的最大编号 + 1。如果记录过不按编号顺序处理的批次（--largest-first），
+        且该批次范围内还有从未处理过（既没有完成也没有失败）的编号，则从其中最小的编号开始，
+        已完成的条目会被跳过。范围内已经没有空缺的批次记录会被清除。
         
         Returns:
             int: 下一个需要处理的 SCP 编号
         """
-        if not self.status_data['completed_items']:
-            return 1
-        
-        # 从已完成的项目中找到最大编号
-        max_completed = 0
+        completed = set()
         for scp_id in self.status_data['completed_items']:
             try:
                 if scp_id.startswith('scp-'):
-                    num = int(scp_id[4:])  # 去掉 "scp-" 前缀
-                    max_completed = max(max_completed, num)
+                    completed.add(int(scp_id[4:]))  # 去掉 "scp-" 前缀
             except ValueError:
                 continue
-        
-        # 返回下一个编号
+        if not completed:
+            return 1
+        max_completed = max(completed)
         next_num = max_completed + 1
+
+        unordered_runs = self.status_data.get('unordered_runs', [])
+        if not unordered_runs:
+            return next_num
+
+        # 在乱序批次的范围内找最小的从未处理过的编号
+        attempted = completed | {
+            int(scp_id[4:]) for scp_id in self.status_data['failed_items']
+            if scp_id.startswith('scp-') and scp_id[4:].isdigit()
+        }
+        remaining = []
+        for run_start, run_end in unordered_runs:
+            gap = next((num for num in range(run_start, min(run_end, max_completed) + 1)
+                        if num not in attempted), None)
+            if gap is not None:
+                remaining.append([run_start, run_end])
+                next_num = min(next_num, gap)
+        if remaining != unordered_runs:
+            self.status_data['unordered_runs'] = remaining
+            self.save_status()
         return next_num
+
+    @_synchronized
+    def record_unordered_run(self, start_num: int, end_num: int):
+        """
+        记录一次不按编号顺序处理的批次，断点接续时会补齐其范围内的空缺
+
+        Args:
+            start_num: 批次起始编号
+            end_num: 批次结束编号
+        """
+        unordered_runs = self.status_data.setdefault('unordered_runs', [])
+        if [start_num, end_num] not in unordered_runs:
+            unordered_runs.append([start_num, end_num])
+            self.save_status()
     
+    @_synchronized
     def save_resume_point(self, scp_num: int):
         """
         保存当前处理点，用于断点接续
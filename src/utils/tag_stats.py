@@ -0,0 +1,255 @@
+"""
+标签统计
+导出时把页面标签转换为整数编号，按条目保存为紧凑数组。
+标签频次和共现次数随条目的更新和删除增量维护；只有统计文件缺失或与旁路文件不一致时，
+才从全部条目重新计算（有 NumPy 时使用矩阵乘法，否则逐条目计数）。
+结束时生成标签概览笔记和机器可读的统计文件。
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+from array import array
+from collections import Counter
+from typing import Dict
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，没有时使用纯 Python 计算
+    np = None
+
+from src.utils.output_sink import OutputSink
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 标签概览笔记路径
+TAGS_NOTE = "SCP-Tags.md"
+
+# 概览笔记中每个标签列出的共现标签数
+TOP_COOCCURRING = 5
+
+# 分块计算共现矩阵时每块的条目数，限制稠密矩阵的内存占用
+_BLOCK_ROWS = 2048
+
+
+def _count_numpy(items: list[array], tag_count: int) -> tuple[list[int], list[tuple[int, int, int]]]:
+    """用 NumPy 分块计算标签频次和共现次数"""
+    frequency = np.zeros(tag_count, dtype=np.int64)
+    cooccurrence = np.zeros((tag_count, tag_count), dtype=np.int64)
+    for start in range(0, len(items), _BLOCK_ROWS):
+        block = items[start:start + _BLOCK_ROWS]
+        lengths = np.fromiter((len(tags) for tags in block), dtype=np.int64, count=len(block))
+        rows = np.repeat(np.arange(len(block)), lengths)
+        columns = np.fromiter(itertools.chain.from_iterable(block), dtype=np.int64,
+                              count=int(lengths.sum()))
+        # 条目 × 标签的 0/1 矩阵，M^T M 即为共现矩阵（对角线为频次）
+        matrix = np.zeros((len(block), tag_count), dtype=np.float32)
+        matrix[rows, columns] = 1
+        frequency += np.bincount(columns, minlength=tag_count)
+        cooccurrence += (matrix.T @ matrix).astype(np.int64)
+
+    first, second = np.nonzero(np.triu(cooccurrence, 1))
+    pairs = [(int(a), int(b), int(cooccurrence[a, b])) for a, b in zip(first, second)]
+    return frequency.tolist(), pairs
+
+
+def _count_python(items: list[array], tag_count: int) -> tuple[list[int], list[tuple[int, int, int]]]:
+    """逐条目计算标签频次和共现次数"""
+    frequency = [0] * tag_count
+    pair_counts: Counter = Counter()
+    for tags in items:
+        for tag_id in tags:
+            frequency[tag_id] += 1
+        pair_counts.update(itertools.combinations(sorted(tags), 2))
+    return frequency, sorted((a, b, count) for (a, b), count in pair_counts.items())
+
+
+class TagStats:
+    """增量维护的标签频次与共现统计，线程安全"""
+
+    def __init__(self, state_dir: str, sink: OutputSink):
+        """
+        Args:
+            state_dir: 旁路文件和统计文件所在目录
+            sink: 标签概览笔记的输出目标
+        """
+        self.index_file = os.path.join(state_dir, 'tag-index.json')
+        self.stats_file = os.path.join(state_dir, 'tag-stats.json')
+        self.sink = sink
+        # 标签 -> 编号，编号在多次运行之间保持不变
+        self.tag_ids: Dict[str, int] = {}
+        self.tag_names: list[str] = []
+        # 条目键 -> 标签编号数组
+        self.items: Dict[str, array] = {}
+        # 标签编号 -> 条目数
+        self.frequency: list[int] = []
+        # (标签编号 a, 标签编号 b) -> 共现条目数，a < b
+        self.pair_counts: Counter = Counter()
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """加载旁路文件"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.tag_names = data.get('tags', [])
+            self.tag_ids = {name: i for i, name in enumerate(self.tag_names)}
+            self.items = {key: array('I', ids) for key, ids in data.get('items', {}).items()}
+        except Exception as e:
+            logger.warning("加载标签索引失败，将重新建立: %s", e)
+            self.tag_names, self.tag_ids, self.items = [], {}, {}
+            return
+        if not self._load_counts():
+            self._recount()
+
+    def _load_counts(self) -> bool:
+        """从上次保存的统计文件加载计数，与旁路文件一致时返回 True"""
+        if not os.path.exists(self.stats_file):
+            return False
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning("加载标签统计失败，将重新计算: %s", e)
+            return False
+        if data.get('items') != len(self.items) or data.get('tags') != self.tag_names:
+            return False
+        self.frequency = data.get('frequency', [])
+        self.pair_counts = Counter({(a, b): count for a, b, count in data.get('cooccurrence', [])})
+        # 统计文件与旁路文件分别写出，中断时可能不一致，核对频次总数
+        return (len(self.frequency) == len(self.tag_names)
+                and sum(self.frequency) == sum(len(ids) for ids in self.items.values()))
+
+    def _recount(self):
+        """从全部条目重新计算频次和共现次数"""
+        counter = _count_numpy if np is not None else _count_python
+        frequency, pairs = counter(list(self.items.values()), len(self.tag_names))
+        self.frequency = list(frequency)
+        self.pair_counts = Counter({(a, b): count for a, b, count in pairs})
+
+    def _apply(self, ids: array, delta: int):
+        """把一个条目的标签计入（delta=1）或移出（delta=-1）统计，调用时需持有锁"""
+        for tag_id in ids:
+            self.frequency[tag_id] += delta
+        for pair in itertools.combinations(ids, 2):
+            count = self.pair_counts[pair] + delta
+            if count:
+                self.pair_counts[pair] = count
+            else:
+                del self.pair_counts[pair]
+
+    def _save(self):
+        """保存旁路文件"""
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': 1,
+                'tags': self.tag_names,
+                'items': {key: ids.tolist() for key, ids in self.items.items()},
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def _intern(self, tag: str) -> int:
+        """返回标签编号，新标签分配新编号，调用时需持有锁"""
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tag_names)
+            self.tag_ids[tag] = tag_id
+            self.tag_names.append(tag)
+            self.frequency.append(0)
+        return tag_id
+
+    def update(self, item_key: str, tags: list[str]):
+        """
+        记录一个条目的标签
+
+        Args:
+            item_key: 条目键，如 "scp-173" 或 "eng:scp-173"
+            tags: 标签列表（不带 "#"）
+        """
+        with self._lock:
+            ids = array('I', sorted({self._intern(tag) for tag in tags}))
+            old = self.items.get(item_key)
+            if old == ids:
+                return
+            if old is not None:
+                self._apply(old, -1)
+            self._apply(ids, 1)
+            self.items[item_key] = ids
+            self.dirty = True
+
+    def remove(self, item_key: str):
+        """移除一个已不存在的条目"""
+        with self._lock:
+            old = self.items.pop(item_key, None)
+            if old is not None:
+                self._apply(old, -1)
+                self.dirty = True
+
+    def _render_note(self, frequency: list[int], pairs: list[tuple[int, int, int]]) -> str:
+        related: Dict[int, list[tuple[int, int]]] = {}
+        for a, b, count in pairs:
+            related.setdefault(a, []).append((count, b))
+            related.setdefault(b, []).append((count, a))
+
+        used = sorted((i for i, count in enumerate(frequency) if count),
+                      key=lambda i: (-frequency[i], self.tag_names[i]))
+        lines = [
+            "# SCP 标签统计",
+            "",
+            f"共 {len(self.items)} 个条目，{len(used)} 个标签",
+            "",
+            "| 标签 | 条目数 | 常见共现标签 |",
+            "| --- | --- | --- |",
+        ]
+        for tag_id in used:
+            top = sorted(related.get(tag_id, []), key=lambda entry: (-entry[0], self.tag_names[entry[1]]))
+            cooccurring = ", ".join(f"#{self.tag_names[other]} ({count})"
+                                    for count, other in top[:TOP_COOCCURRING])
+            cooccurring = cooccurring.replace('|', '\\|')
+            tag = f"#{self.tag_names[tag_id]}".replace('|', '\\|')
+            lines.append(f"| {tag} | {frequency[tag_id]} | {cooccurring} |")
+        return "\n".join(lines) + "\n"
+
+    def flush(self, force: bool = False) -> bool:
+        """
+        有变化时写出标签概览笔记和统计文件
+
+        Args:
+            force: 没有变化时也重新生成（归档输出中需要包含概览笔记）
+
+        Returns:
+            bool: 是否重新生成
+        """
+        with self._lock:
+            if not self.dirty and not force:
+                return False
+
+            items = list(self.items.values())
+            frequency = list(self.frequency)
+            pairs = sorted((a, b, count) for (a, b), count in self.pair_counts.items())
+
+            self.sink.write_text(TAGS_NOTE, self._render_note(frequency, pairs))
+            tmp_file = f"{self.stats_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': 1,
+                    'items': len(items),
+                    'tags': self.tag_names,
+                    'frequency': frequency,
+                    # [标签编号 a, 标签编号 b, 共现条目数]，a < b
+                    'cooccurrence': pairs,
+                }, f, ensure_ascii=False)
+            self._save()
+            os.replace(tmp_file, self.stats_file)
+            self.dirty = False
+        logger.info("标签统计已更新: %d 个条目, %d 个标签", len(items), sum(1 for count in frequency if count))
+        return True
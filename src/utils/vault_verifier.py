@@ -0,0 +1,171 @@
+"""
+库校验
+将导出的库与输出清单、ZIM 归档和处理状态对比，找出缺失或被截断的笔记、
+与归档中原图不一致的图片以及不属于导出结果的多余文件。
+文件哈希和 ZIM 读取在线程池中并行完成（hashlib 和 libzim 在处理大块数据时会释放 GIL）。
+"""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional
+
+from src.handle_zim.readzim import ReadZIM
+from src.utils.filepath_tool import get_scp_subdirectory
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 问题类型 -> 显示名称
+PROBLEM_KINDS = {
+    'missing': '缺失',
+    'truncated': '截断',
+    'modified': '内容不一致',
+    'image_mismatch': '图片与归档不一致',
+    'orphan': '多余文件',
+}
+
+
+def _file_digest(path: str) -> str:
+    """计算文件内容的哈希（十六进制）"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def note_path_for_item(item_key: str) -> str:
+    """
+    根据跟踪器中的条目键返回笔记的库内路径
+
+    Args:
+        item_key: 如 "scp-173" 或 "eng:scp-173"
+
+    Returns:
+        str: 如 "001-1000/scp-173.md" 或 "eng/001-1000/scp-173.md"
+    """
+    label, _, scp_id = item_key.rpartition(':')
+    note = f"{get_scp_subdirectory(scp_id)}/{scp_id}.md"
+    return f"{label}/{note}" if label else note
+
+
+class VaultVerifier:
+    """并行校验导出的库"""
+
+    def __init__(self, vault_dir: str, manifest: Dict[str, dict], assets: Dict[str, dict],
+                 archives: Dict[str, ReadZIM], completed_items: list[str],
+                 workers: Optional[int] = None):
+        """
+        Args:
+            vault_dir: 库根目录
+            manifest: 输出清单 {相对路径: {"size", "hash"}}
+            assets: 图片来源记录 {库内路径: {"archive", "source", "hash", "output"}}
+            archives: 归档子目录名 -> ZIM 归档，主归档为 ""
+            completed_items: 跟踪器中已完成的条目键
+            workers: 线程数，默认由 ThreadPoolExecutor 决定
+        """
+        self.vault_dir = vault_dir
+        self.manifest = manifest
+        self.assets = assets
+        self.archives = archives
+        self.completed_items = completed_items
+        self.workers = workers
+
+    def _check_file(self, rel_path: str, expected: Optional[dict]) -> Optional[tuple[str, str, str]]:
+        """检查一个应当存在的文件，expected 为 None 时只检查是否存在"""
+        path = os.path.join(self.vault_dir, rel_path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 'missing', rel_path, "文件不存在"
+        if expected is None:
+            return None if size else ('truncated', rel_path, "文件为空")
+        if size < expected['size']:
+            return 'truncated', rel_path, f"{size} < {expected['size']} 字节"
+        if size != expected['size'] or _file_digest(path) != expected['hash']:
+            return 'modified', rel_path, "哈希与清单不一致"
+        return None
+
+    def _check_image(self, vault_path: str, record: dict) -> Optional[tuple[str, str, str]]:
+        """将图片与 ZIM 中的原图对比"""
+        output = record.get('output') or vault_path
+        zim = self.archives.get(record.get('archive', ''))
+        if zim is None:
+            return None
+        data = zim.get_img(record['source'])
+        if data is None:
+            return 'image_mismatch', output, f"归档中已不存在: {record['source']}"
+        source_hash = hashlib.blake2b(data).hexdigest()
+        if source_hash != record['hash']:
+            return 'image_mismatch', output, "归档中的原图已变化"
+        if output == vault_path:
+            # 未转码的图片应与原图逐字节相同
+            try:
+                if _file_digest(os.path.join(self.vault_dir, output)) != source_hash:
+                    return 'image_mismatch', output, "与归档中的原图不同"
+            except OSError:
+                # 文件缺失由 _check_file 报告
+                return None
+        return None
+
+    def _find_orphans(self, expected: set[str]) -> list[tuple[str, str, str]]:
+        """遍历库目录，找出不在清单中的文件（跳过 .scp-obsidian、.obsidian 等隐藏目录）"""
+        orphans = []
+        for dirpath, dirnames, filenames in os.walk(self.vault_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                rel_path = os.path.relpath(os.path.join(dirpath, filename), self.vault_dir)
+                rel_path = rel_path.replace(os.sep, '/')
+                if rel_path not in expected:
+                    orphans.append(('orphan', rel_path, "不在输出清单中"))
+        return orphans
+
+    def run(self, on_progress: Optional[Callable[[int, int], None]] = None) -> dict:
+        """
+        执行校验
+
+        Args:
+            on_progress: 进度回调 on_progress(已完成检查数, 检查总数)
+
+        Returns:
+            dict: {"checked": 检查数, "problems": {问题类型: [{"path", "detail"}]}}
+        """
+        # 清单中的文件逐个校验哈希；旧版本导出的、只记录在跟踪器中的笔记只检查是否存在
+        checks: Dict[str, Optional[dict]] = dict(self.manifest)
+        for item_key in self.completed_items:
+            checks.setdefault(note_path_for_item(item_key), None)
+        for path, record in self.assets.items():
+            checks.setdefault(record.get('output') or path, None)
+        image_checks = {path: record for path, record in self.assets.items()
+                        if record.get('archive', '') in self.archives}
+
+        problems: Dict[str, list] = {kind: [] for kind in PROBLEM_KINDS}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._check_file, path, expected)
+                       for path, expected in checks.items()]
+            futures += [pool.submit(self._check_image, path, record)
+                        for path, record in image_checks.items()]
+            orphans = pool.submit(self._find_orphans, set(checks))
+
+            for done, future in enumerate(as_completed(futures), 1):
+                if on_progress is not None:
+                    on_progress(done, len(futures))
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error("校验时发生异常: %s", e)
+                    continue
+                if result is not None:
+                    kind, path, detail = result
+                    problems[kind].append({'path': path, 'detail': detail})
+
+            for kind, path, detail in orphans.result():
+                problems[kind].append({'path': path, 'detail': detail})
+
+        for entries in problems.values():
+            entries.sort(key=lambda entry: entry['path'])
+        logger.info("库校验完成: %d 项检查, %s", len(futures),
+                    {PROBLEM_KINDS[kind]: len(entries) for kind, entries in problems.items()})
+        return {'checked': len(futures), 'problems': problems}
@@ -0,0 +1,213 @@
+"""
+条目处理看门狗
+为每个条目设置处理时间和内存预算。后台线程定期检查正在处理的条目，
+超出预算时向处理线程注入异常（PyThreadState_SetAsyncExc），中止该条目的处理。
+异常在线程执行下一条 Python 字节码时抛出，因此能中止 BeautifulSoup 解析、
+markdownify 转换等纯 Python 的长时间处理，但不能打断正在执行的单个 C 调用。
+异常只会在 abortable() 标记的阶段中注入，写文件、更新状态等步骤不会被打断到一半；
+阶段中的日志记录暂存到阶段结束后再写出，异常不会在日志处理器持有锁时抛出。
+"""
+
+import ctypes
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from src.utils.log_tool import deferred_logging
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+class ItemBudgetExceeded(BaseException):
+    """
+    条目超出处理预算
+
+    继承 BaseException，避免被处理流程中的 except Exception 捕获。
+    """
+    failure_class = "budget"
+    message = "超出处理预算"
+
+    def __str__(self):
+        return self.message
+
+
+class ItemTimeout(ItemBudgetExceeded):
+    """条目处理超时"""
+    failure_class = "timeout"
+    message = "处理超时"
+
+
+class ItemMemoryExceeded(ItemBudgetExceeded):
+    """处理条目时进程内存超出上限"""
+    failure_class = "memory"
+    message = "内存超出上限"
+
+
+def current_rss() -> Optional[int]:
+    """
+    返回当前进程的常驻内存（字节）
+
+    Returns:
+        Optional[int]: 常驻内存大小，当前系统不支持时返回 None
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _inject(thread_id: int, exc_type: Optional[type]) -> bool:
+    """向线程注入异常，exc_type 为 None 时清除尚未抛出的异常"""
+    result = ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exc_type) if exc_type is not None else None)
+    return result == 1
+
+
+@dataclass
+class _Watch:
+    key: str
+    start: float
+    # 是否处于可以中止的阶段
+    abortable: bool = False
+    # 已注入的异常类型
+    fired: Optional[type] = None
+
+
+class ItemWatchdog:
+    """条目处理时间与内存预算的看门狗，线程安全"""
+
+    def __init__(self, time_limit: float = 0, memory_limit: int = 0, interval: float = 0.5):
+        """
+        Args:
+            time_limit: 单个条目的最长处理时间（秒），0 表示不限制
+            memory_limit: 进程常驻内存上限（字节），超出时中止处理时间最长的条目，0 表示不限制
+            interval: 检查间隔（秒）
+        """
+        if memory_limit and current_rss() is None:
+            logger.warning("当前系统无法读取进程内存，内存上限不会生效")
+            memory_limit = 0
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.interval = interval
+        # 处理线程 ID -> 正在处理的条目
+        self._active: Dict[int, _Watch] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="item-watchdog", daemon=True)
+        self.timeouts = 0
+        self.memory_aborts = 0
+        self._thread.start()
+
+    def run(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在预算内执行 func，超出预算时在 func 的 abortable() 阶段中抛出 ItemTimeout 或 ItemMemoryExceeded
+
+        Args:
+            key: 条目键，用于日志
+            func: 处理函数
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = _Watch(key, time.monotonic())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                watch = self._active.pop(thread_id, None)
+                if watch is not None and watch.fired:
+                    # 异常可能已注入但还没抛出，清除它，避免在之后的条目中抛出
+                    _inject(thread_id, None)
+
+    @contextmanager
+    def abortable(self):
+        """
+        标记当前线程中可以被中止的处理阶段（解析、转换等），不在 run 中调用时不起作用
+
+        阶段开始时已经超时则直接抛出 ItemTimeout；阶段结束时尚未抛出的异常会被清除并立即抛出，
+        保证异常不会在阶段之外抛出。阶段中产生的日志记录先暂存，阶段结束后再写出，
+        避免异常在日志处理器持有锁时抛出。
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            watch = self._active.get(thread_id)
+        if watch is None:
+            yield
+            return
+
+        with deferred_logging():
+            with self._lock:
+                if self.time_limit and time.monotonic() - watch.start > self.time_limit:
+                    logger.warning("条目处理超时，中止: %s", watch.key)
+                    self.timeouts += 1
+                    watch.fired = ItemTimeout
+                if watch.fired is None:
+                    watch.abortable = True
+            if watch.fired is not None:
+                raise watch.fired()
+
+            try:
+                yield
+            except BaseException:
+                self._leave(thread_id, watch)
+                raise
+            if self._leave(thread_id, watch):
+                raise watch.fired()
+
+    def _leave(self, thread_id: int, watch: _Watch) -> bool:
+        """结束可中止阶段，返回是否有已注入但尚未抛出的异常"""
+        with self._lock:
+            watch.abortable = False
+            if watch.fired is not None:
+                _inject(thread_id, None)
+                return True
+        return False
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._check()
+            except Exception as e:
+                logger.error("看门狗检查失败: %s", e)
+
+    def _check(self):
+        now = time.monotonic()
+        rss = current_rss() if self.memory_limit else None
+        with self._lock:
+            if self.time_limit:
+                for thread_id, watch in self._active.items():
+                    if watch.abortable and not watch.fired and now - watch.start > self.time_limit:
+                        logger.warning("条目处理超时，中止: %s (%.1f 秒)", watch.key, now - watch.start)
+                        if _inject(thread_id, ItemTimeout):
+                            watch.fired = ItemTimeout
+                            self.timeouts += 1
+
+            if rss is not None and rss > self.memory_limit:
+                # 中止处理时间最长的条目，每次检查只中止一个，给内存回收留出时间
+                candidates = [(watch.start, thread_id) for thread_id, watch in self._active.items()
+                              if watch.abortable and not watch.fired]
+                if candidates:
+                    _, thread_id = min(candidates)
+                    watch = self._active[thread_id]
+                    logger.warning("进程内存 %.0f MB 超出上限，中止: %s",
+                                   rss / (1024 * 1024), watch.key)
+                    if _inject(thread_id, ItemMemoryExceeded):
+                        watch.fired = ItemMemoryExceeded
+                        self.memory_aborts += 1
+
+    def close(self):
+        """停止看门狗线程"""
+        self._stop_event.set()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        """返回中止统计"""
+        return {
+            "超时": self.timeouts,
+            "内存超限": self.memory_aborts,
+        }
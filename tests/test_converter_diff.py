@@ -0,0 +1,27 @@
+"""转换配置与基准配置在黄金语料上的输出一致性测试"""
+
+import os
+
+import pytest
+
+from src.html_parser.converter_diff import CONFIGS, compare, iter_html_dir
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "converter")
+
+
+def test_fixture_corpus_is_processed():
+    pages = list(iter_html_dir(FIXTURE_DIR))
+    assert len(pages) >= 5
+    result = compare(iter(pages), CONFIGS["baseline"], CONFIGS["baseline"])
+    assert result["pages"] == len(pages)
+    assert result["mismatches"] == []
+
+
+@pytest.mark.parametrize("name", [name for name in CONFIGS if name != "baseline"])
+def test_config_matches_baseline(name):
+    config = CONFIGS[name]
+    if not config.available:
+        pytest.skip(f"需要安装 {config.requires}")
+    result = compare(iter_html_dir(FIXTURE_DIR), CONFIGS["baseline"], config)
+    assert result["pages"] == len(os.listdir(FIXTURE_DIR))
+    assert result["mismatches"] == []
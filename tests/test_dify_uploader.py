@@ -0,0 +1,167 @@
+"""DifyUploader 的连接池与重试测试，使用本地的模拟 Dify 服务"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from src.utils.dify_uploader import DifyClient, DifyUploader
+from src.utils.processing_tracker import SCPProcessingTracker
+
+DATASET = "ds"
+
+
+class FakeDify:
+    """模拟 Dify 知识库 API，可以按路径注入故障"""
+
+    def __init__(self):
+        self.documents: dict[str, str] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.clients: set[tuple[str, int]] = set()
+        # 文档名 -> 依次执行的故障: "429" 返回限流，"drop" 创建文档后不返回响应直接断开
+        self.faults: dict[str, list[str]] = {}
+        self.lock = threading.Lock()
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                with fake.lock:
+                    fake.clients.add(self.client_address)
+                    fake.requests.append(('GET', self.path))
+                query = parse_qs(urlsplit(self.path).query)
+                keyword = query.get('keyword', [''])[0]
+                with fake.lock:
+                    data = [{'id': doc_id, 'name': name}
+                            for name, doc_id in fake.documents.items() if keyword in name]
+                self._reply(200, {'data': data})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                name = body['name']
+                with fake.lock:
+                    fake.clients.add(self.client_address)
+                    fake.requests.append(('POST', self.path))
+                    faults = fake.faults.get(name, [])
+                    fault = faults.pop(0) if faults else None
+                if fault == '429':
+                    self._reply(429, {'message': 'rate limited'})
+                    return
+                with fake.lock:
+                    doc_id = fake.documents.setdefault(name, f"doc-{len(fake.documents) + 1}")
+                if fault == 'drop':
+                    # 文档已创建，但响应丢失
+                    self.close_connection = True
+                    return
+                self._reply(200, {'document': {'id': doc_id}})
+
+        return Handler
+
+
+@pytest.fixture
+def fake_server():
+    fake = FakeDify()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), fake.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield fake, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "001-1000").mkdir(parents=True)
+    (vault_dir / ".scp-obsidian").mkdir()
+    (vault_dir / ".scp-obsidian" / "ignored.md").write_text("x", encoding='utf-8')
+    for i in range(1, 21):
+        (vault_dir / "001-1000" / f"scp-{i:03d}.md").write_text(f"# SCP-{i:03d}", encoding='utf-8')
+    return vault_dir
+
+
+def make_uploader(base_url, tmp_path, vault, workers=4):
+    client = DifyClient(base_url, "key", DATASET, timeout=5)
+    (tmp_path / "logs").mkdir(exist_ok=True)
+    tracker = SCPProcessingTracker(str(tmp_path / "logs"))
+    uploader = DifyUploader(client, tracker, str(vault), workers=workers, max_retries=3, backoff=0.01)
+    return client, tracker, uploader
+
+
+def test_upload_reuses_pooled_connections(fake_server, tmp_path, vault):
+    fake, base_url = fake_server
+    client, _, uploader = make_uploader(base_url, tmp_path, vault, workers=4)
+    try:
+        documents = uploader.find_documents()
+        assert len(documents) == 20
+        uploader.upload_all(documents)
+    finally:
+        client.close()
+
+    assert uploader.uploaded == 20
+    assert len(fake.documents) == 20
+    # 长连接在请求之间复用，连接数不超过并发数
+    assert client.connections_opened <= 4
+    assert len(fake.clients) <= 4
+
+
+def test_retries_rate_limited_requests(fake_server, tmp_path, vault):
+    fake, base_url = fake_server
+    fake.faults["001-1000/scp-001.md"] = ['429', '429']
+    client, _, uploader = make_uploader(base_url, tmp_path, vault, workers=2)
+    try:
+        uploader.upload_all(uploader.find_documents())
+    finally:
+        client.close()
+
+    assert uploader.failed == 0
+    assert uploader.retries == 2
+    assert len(fake.documents) == 20
+
+
+def test_lost_create_response_does_not_duplicate(fake_server, tmp_path, vault):
+    fake, base_url = fake_server
+    fake.faults["001-1000/scp-002.md"] = ['drop']
+    client, tracker, uploader = make_uploader(base_url, tmp_path, vault, workers=1)
+    try:
+        assert uploader.upload_one("001-1000/scp-002.md")
+    finally:
+        client.close()
+
+    creates = [path for method, path in fake.requests if method == 'POST']
+    assert len(creates) == 1
+    assert tracker.get_upload("001-1000/scp-002.md")['document_id'] == fake.documents["001-1000/scp-002.md"]
+
+
+def test_unchanged_documents_are_skipped(fake_server, tmp_path, vault):
+    fake, base_url = fake_server
+    client, _, uploader = make_uploader(base_url, tmp_path, vault)
+    try:
+        uploader.upload_all(uploader.find_documents())
+        (vault / "001-1000" / "scp-003.md").write_text("# changed", encoding='utf-8')
+        client2, _, second = make_uploader(base_url, tmp_path, vault)
+        second.upload_all(second.find_documents())
+        client2.close()
+    finally:
+        client.close()
+
+    assert second.uploaded == 1
+    assert second.skipped == 19
+    updates = [path for method, path in fake.requests if 'update-by-text' in path]
+    assert len(updates) == 1
@@ -0,0 +1,49 @@
+"""SCPProcessingTracker 断点接续起始点的测试"""
+
+import pytest
+
+from src.utils.processing_tracker import SCPProcessingTracker
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = SCPProcessingTracker(str(tmp_path))
+    tracker.start_session()
+    return tracker
+
+
+def test_resume_starts_after_largest_completed(tracker):
+    assert tracker.get_resume_point() == 1
+    for num in (1, 2, 3):
+        tracker.record_success(f"scp-{num:03d}")
+    assert tracker.get_resume_point() == 4
+
+
+def test_resume_after_partial_range_does_not_restart(tracker):
+    # --start 500 和 --single 留下的空缺不需要补齐
+    for num in range(500, 511):
+        tracker.record_success(f"scp-{num:03d}")
+    tracker.record_success("scp-5000")
+    assert tracker.get_resume_point() == 5001
+
+
+def test_resume_fills_gaps_of_unordered_run(tracker):
+    tracker.record_success("scp-001")
+    tracker.record_success("scp-5000")
+    tracker.record_unordered_run(100, 200)
+    for num in (100, 101, 150, 200):
+        tracker.record_success(f"scp-{num:03d}")
+    tracker.record_failure("scp-102", "error")
+    assert tracker.get_resume_point() == 103
+
+    for num in range(103, 200):
+        tracker.record_success(f"scp-{num:03d}")
+    assert tracker.get_resume_point() == 5001
+    # 范围内没有空缺后清除记录
+    assert tracker.status_data['unordered_runs'] == []
+
+
+def test_unordered_run_survives_reload(tracker, tmp_path):
+    tracker.record_unordered_run(1, 10)
+    tracker.record_success("scp-010")
+    assert SCPProcessingTracker(str(tmp_path)).get_resume_point() == 1
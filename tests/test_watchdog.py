@@ -0,0 +1,69 @@
+"""ItemWatchdog 中止处理与暂存日志的测试"""
+
+import logging
+import threading
+
+import pytest
+
+from src.utils.log_tool import _DeferringHandler, deferred_logging
+from src.utils.watchdog import ItemTimeout, ItemWatchdog
+
+
+class CollectingHandler(logging.Handler):
+    """记录收到的日志"""
+
+    def __init__(self):
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def collected():
+    handler = CollectingHandler()
+    test_logger = logging.getLogger("tests.watchdog")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.INFO)
+    deferring = _DeferringHandler(handler)
+    test_logger.addHandler(deferring)
+    yield test_logger, handler
+    test_logger.removeHandler(deferring)
+
+
+def test_deferred_records_are_emitted_on_exit(collected):
+    test_logger, handler = collected
+    with deferred_logging():
+        test_logger.info("first")
+        with deferred_logging():
+            test_logger.info("second")
+        assert handler.records == []
+    assert [record.getMessage() for record in handler.records] == ["first", "second"]
+
+
+def test_timeout_in_logging_region_does_not_hold_handler_lock(collected):
+    test_logger, handler = collected
+    watchdog = ItemWatchdog(time_limit=0.05, interval=0.01)
+    in_region = threading.Event()
+
+    def work():
+        with watchdog.abortable():
+            in_region.set()
+            while True:
+                test_logger.info("parsing")
+
+    try:
+        with pytest.raises(ItemTimeout):
+            watchdog.run("scp-001", work)
+    finally:
+        watchdog.close()
+
+    assert in_region.is_set()
+    assert watchdog.timeouts == 1
+    # 阶段中的日志在阶段结束后才交给处理器，处理器的锁没有被遗留
+    assert handler.records
+    assert handler.lock.acquire(timeout=1)
+    handler.lock.release()
+    test_logger.info("after")
+    assert handler.records[-1].getMessage() == "after"